@@ -0,0 +1,202 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "mutagen",
+# ]
+# ///
+"""Benchmark rename_tracks against directories of synthetic audio files"""
+
+import argparse
+import struct
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3, TRCK
+from mutagen.mp4 import MP4
+from mutagen.ogg import OggPage
+from mutagen.oggopus import OggOpus
+from rename_tracks import BOOKS_CSV, apply_changes, find_tracks, get_book_chapters, plan_changes
+
+N_TRACKS = 1189
+FORMATS = ['m4a', 'mp3', 'flac', 'opus']
+SIZES = [1024, 32768]
+SUITES = ['rename', 'formats']
+
+
+def _atom(name: bytes, data: bytes = b'') -> bytes:
+    return struct.pack('>I4s', 8 + len(data), name) + data
+
+
+def _full_atom(name: bytes, data: bytes) -> bytes:
+    """Atom with version + flags"""
+    return _atom(name, b'\0' * 4 + data)
+
+
+def _write_m4a(path: Path, track_number: int, audio_kb: int):
+    mvhd = _full_atom(b'mvhd', struct.pack('>IIII', 0, 0, 1000, 60000) + b'\0' * 80)
+    mdhd = _full_atom(b'mdhd', struct.pack('>IIIIHH', 0, 0, 44100, 44100 * 60, 0x55C4, 0))
+    hdlr = _full_atom(b'hdlr', struct.pack('>I4s12s', 0, b'soun', b'') + b'\0')
+    moov = _atom(b'moov', mvhd + _atom(b'trak', _atom(b'mdia', mdhd + hdlr)))
+    ftyp = _atom(b'ftyp', b'M4A \0\0\0\0M4A mp42isom')
+    path.write_bytes(ftyp + moov + _atom(b'mdat', b'\0' * audio_kb * 1024))
+
+    track = MP4(path)
+    track.add_tags()
+    track.tags['trkn'] = [(track_number, N_TRACKS)]
+    track.save()
+
+
+def _write_mp3(path: Path, track_number: int, audio_kb: int):
+    path.write_bytes(b'\xff\xfb\x90\x00' * audio_kb * 256)
+    tags = ID3()
+    tags.add(TRCK(encoding=3, text=f'{track_number}/{N_TRACKS}'))
+    tags.save(path)
+
+
+def _write_flac(path: Path, track_number: int, audio_kb: int):
+    # STREAMINFO: block sizes, frame sizes, then sample rate, channels, bits/sample, total samples
+    samples = (44100 << 44) | (15 << 36) | (44100 * 60)
+    streaminfo = struct.pack('>HH6xQ16x', 4096, 4096, samples)
+    header = b'fLaC' + bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo
+    path.write_bytes(header + b'\xff\xf8' + b'\0' * audio_kb * 1024)
+    track = FLAC(path)
+    track.add_tags()
+    track['tracknumber'] = str(track_number)
+    track.save()
+
+
+def _write_opus(path: Path, track_number: int, audio_kb: int):
+    def page(packet: bytes, sequence: int, position: int) -> bytes:
+        ogg_page = OggPage()
+        ogg_page.packets, ogg_page.serial = [packet], 1
+        ogg_page.sequence, ogg_page.position = sequence, position
+        ogg_page.first = sequence == 0
+        ogg_page.last = sequence == audio_kb + 1
+        return ogg_page.write()
+
+    opus_head = b'OpusHead' + struct.pack('<BBHIhB', 1, 1, 312, 48000, 0, 0)
+    opus_tags = b'OpusTags' + struct.pack('<I', 5) + b'bench' + struct.pack('<I', 0)
+    pages = [page(opus_head, 0, 0), page(opus_tags, 1, 0)]
+    # 1 page of 'audio' per KB, at 50ms each
+    pages += [page(b'\0' * 1000, i + 2, (i + 1) * 2400) for i in range(audio_kb)]
+    path.write_bytes(b''.join(pages))
+    track = OggOpus(path)
+    track['tracknumber'] = str(track_number)
+    track.save()
+
+
+def write_synthetic_track(path: Path, track_number: int, audio_kb: int):
+    """Write a minimal audio file in the format given by the file extension, with silent 'audio'
+    data and a track number
+    """
+    writers = {'.m4a': _write_m4a, '.mp3': _write_mp3, '.flac': _write_flac, '.opus': _write_opus}
+    writers[path.suffix](path, track_number, audio_kb)
+
+
+def bench_rename(n_tracks: int, audio_kb: int, workers: list[int], base_dir: Path | None):
+    """Measure time to plan and apply changes for a directory of untagged M4A tracks, for each
+    worker count, and to plan again once all tracks are up to date
+    """
+    book_chapters = get_book_chapters(Path(__file__).parent / BOOKS_CSV)
+    print(f'\nRename: {n_tracks} tracks x {audio_kb} KB')
+    print(f'{"workers":>8} {"plan":>8} {"apply":>8} {"replan":>8} {"speedup":>8}')
+    baseline = None
+    for n_workers in workers:
+        with TemporaryDirectory(dir=base_dir) as tmp_dir:
+            audio_dir = Path(tmp_dir)
+            for i in range(n_tracks):
+                write_synthetic_track(audio_dir / f'track_{i + 1}.m4a', i + 1, audio_kb)
+            paths = find_tracks(audio_dir)
+
+            start = perf_counter()
+            changes = plan_changes(paths, book_chapters, n_workers)
+            planned = perf_counter()
+            apply_changes(changes, n_workers, audio_dir / 'journal.jsonl')
+            applied = perf_counter()
+            assert not plan_changes(find_tracks(audio_dir), book_chapters, n_workers)
+            replanned = perf_counter()
+
+        total = applied - start
+        baseline = baseline or total
+        print(
+            f'{n_workers:>8} {planned - start:>8.2f} {applied - planned:>8.2f} '
+            f'{replanned - applied:>8.2f} {baseline / total:>7.1f}x'
+        )
+
+
+def bench_formats(formats: list[str], sizes: list[int], n_tracks: int, base_dir: Path | None):
+    """Measure time per track to read and rewrite tags for each format and file size, and how many
+    files had to be rewritten instead of updated in place. With enough padding, neither should
+    depend on file size.
+    """
+    book_chapters = get_book_chapters(Path(__file__).parent / BOOKS_CSV)
+    print(f'\nTag rewrite: {n_tracks} tracks per format and size')
+    print(f'{"format":>8} {"KB":>8} {"plan ms":>8} {"apply ms":>9} {"rewritten":>10}')
+    for fmt in formats:
+        for audio_kb in sizes:
+            with TemporaryDirectory(dir=base_dir) as tmp_dir:
+                audio_dir = Path(tmp_dir)
+                for i in range(n_tracks):
+                    write_synthetic_track(audio_dir / f'track_{i + 1}.{fmt}', i + 1, audio_kb)
+                paths = find_tracks(audio_dir)
+                inodes = {p.stat().st_ino for p in paths}
+                sizes_before = sum(p.stat().st_size for p in paths)
+
+                start = perf_counter()
+                changes = plan_changes(paths, book_chapters, 1)
+                planned = perf_counter()
+                apply_changes(changes, 1, audio_dir / 'journal.jsonl')
+                applied = perf_counter()
+
+                new_paths = find_tracks(audio_dir)
+                assert len(changes) == n_tracks and len(new_paths) == n_tracks
+                sizes_after = sum(p.stat().st_size for p in new_paths)
+                # Files rewritten from scratch (instead of in place) get a new inode or size
+                n_rewritten = len(inodes - {p.stat().st_ino for p in new_paths})
+                n_rewritten = n_rewritten or (n_tracks if sizes_after != sizes_before else 0)
+
+            print(
+                f'{fmt:>8} {audio_kb:>8} {(planned - start) * 1000 / n_tracks:>8.2f} '
+                f'{(applied - planned) * 1000 / n_tracks:>9.2f} {n_rewritten:>10}'
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--n-tracks', type=int, default=N_TRACKS, help='Number of tracks')
+    parser.add_argument(
+        '-s', '--size', type=int, default=256, help='Size of audio data per track (KB)'
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Worker counts'
+    )
+    parser.add_argument(
+        '-d',
+        '--dir',
+        type=Path,
+        help='Directory to create test files in, e.g. on a network share (default: system temp)',
+    )
+    parser.add_argument(
+        '-f', '--formats', nargs='+', choices=FORMATS, default=FORMATS, help='Formats to compare'
+    )
+    parser.add_argument(
+        '-z', '--sizes', type=int, nargs='+', default=SIZES, help='File sizes to compare (KB)'
+    )
+    parser.add_argument(
+        '-t', '--n-format-tracks', type=int, default=20, help='Number of tracks per format and size'
+    )
+    parser.add_argument(
+        '-S', '--suites', nargs='+', choices=SUITES, default=SUITES, help='Benchmarks to run'
+    )
+    args = parser.parse_args()
+    if 'rename' in args.suites:
+        bench_rename(args.n_tracks, args.size, args.workers, args.dir)
+    if 'formats' in args.suites:
+        bench_formats(args.formats, args.sizes, args.n_format_tracks, args.dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,22 +6,168 @@
 # ]
 # ///
 
+import argparse
 import csv
+import json
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
 from logging import basicConfig, getLogger
 from pathlib import Path
 from typing import Iterable
 
-from mutagen.mp4 import MP4
+from mutagen import MutagenError
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3, TIT1, TIT2
+from mutagen.mp4 import Atoms as MP4Atoms
+from mutagen.mp4 import MP4Tags
+from mutagen.ogg import OggFileType
+from mutagen.oggopus import OggOpus
+from mutagen.oggvorbis import OggVorbis
 
 logger = getLogger(__name__)
 basicConfig(level='DEBUG')
 BookChapters = list[tuple[str, int]]
 
 AUDIO_DIR = Path('audio_bible')
+BOOKS_CSV = Path('books.csv')
+# Planned and completed changes, so an interrupted run can be resumed
+JOURNAL = Path('rename_journal.jsonl')
+# Max files to read or write at once. Mostly waiting on I/O, so this can be higher than CPU count.
+WORKERS = 8
 
 
-def get_book_chapters() -> BookChapters:
-    with open('books.csv') as csvfile:
+class Tagger(ABC):
+    """Reads and writes the track number, title, and group tags for one audio format.
+
+    Only the tag region of each file is read, and tags are saved with mutagen's default padding
+    behavior: if the new tags fit in the existing padding, they're written in place without
+    touching the audio data; otherwise the file is rewritten once, with extra padding for next time.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @property
+    @abstractmethod
+    def track_number(self) -> int: ...
+
+    @abstractmethod
+    def matches(self, title: str, group: str) -> bool:
+        """Check if the title and group tags already have these values"""
+
+    @abstractmethod
+    def write(self, title: str, group: str): ...
+
+
+class MP4Tagger(Tagger):
+    """Tagger for M4A/MP4 files. Only the atom tree is read (skipping over the media data), and
+    only the ``ilst`` metadata atom is parsed.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        with open(path, 'rb') as f:
+            self.tags = MP4Tags(MP4Atoms(f), f)
+
+    @property
+    def track_number(self) -> int:
+        idx = self.tags['trkn']
+        while isinstance(idx, Iterable):
+            idx = idx[0]
+        return idx
+
+    def matches(self, title: str, group: str) -> bool:
+        return self.tags.get('©nam') == [title] and self.tags.get('©grp') == [group]
+
+    def write(self, title: str, group: str):
+        self.tags['©nam'] = title
+        self.tags['©grp'] = group
+        self.tags.save(self.path)
+
+
+class ID3Tagger(Tagger):
+    """Tagger for MP3 files. Only the ID3 tag at the start of the file is read."""
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.tags = ID3(path)
+
+    @property
+    def track_number(self) -> int:
+        # Formatted as 'N' or 'N/total'
+        return int(str(self.tags['TRCK']).split('/')[0])
+
+    def matches(self, title: str, group: str) -> bool:
+        return str(self.tags.get('TIT2', '')) == title and str(self.tags.get('TIT1', '')) == group
+
+    def write(self, title: str, group: str):
+        self.tags.setall('TIT2', [TIT2(encoding=3, text=title)])
+        self.tags.setall('TIT1', [TIT1(encoding=3, text=group)])
+        self.tags.save(self.path)
+
+
+class VorbisCommentTagger(Tagger):
+    """Tagger for formats with Vorbis comments. For FLAC, only the metadata blocks before the
+    audio frames are read; for Ogg, only the header pages (and the last page, for stream length).
+    """
+
+    file_type: type[FLAC] | type[OggFileType]
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.file = self.file_type(path)
+
+    @property
+    def track_number(self) -> int:
+        return int(self.file['tracknumber'][0].split('/')[0])
+
+    def matches(self, title: str, group: str) -> bool:
+        return self.file.get('title') == [title] and self.file.get('grouping') == [group]
+
+    def write(self, title: str, group: str):
+        self.file['title'] = title
+        self.file['grouping'] = group
+        self.file.save()
+
+
+class FLACTagger(VorbisCommentTagger):
+    file_type = FLAC
+
+
+class OpusTagger(VorbisCommentTagger):
+    file_type = OggOpus
+
+
+class OggVorbisTagger(VorbisCommentTagger):
+    file_type = OggVorbis
+
+
+# Taggers by file extension
+TAGGERS: dict[str, type[Tagger]] = {
+    '.m4a': MP4Tagger,
+    '.m4b': MP4Tagger,
+    '.mp4': MP4Tagger,
+    '.mp3': ID3Tagger,
+    '.flac': FLACTagger,
+    '.opus': OpusTagger,
+    '.ogg': OggVorbisTagger,
+}
+
+
+@dataclass
+class TrackChange:
+    """Metadata and filename to write for a single track"""
+
+    path: str
+    new_path: str
+    title: str
+    group: str
+    write_tags: bool = True  # False if tags already match, and only the file needs to be renamed
+
+
+def get_book_chapters(path: Path = BOOKS_CSV) -> BookChapters:
+    with open(path) as csvfile:
         reader = csv.reader(csvfile)
         book_n_chapters = {row[0]: int(row[1]) for row in reader}
 
@@ -34,34 +180,136 @@ def get_book_chapters() -> BookChapters:
     return book_chapters
 
 
-def write_track_name(path: Path, book_chapters: BookChapters):
-    track = MP4(path)
+def find_tracks(audio_dir: Path) -> list[Path]:
+    """Find audio files in a supported format, in a directory and all its subdirectories"""
+    return sorted(p for p in audio_dir.rglob('*') if p.suffix.lower() in TAGGERS and p.is_file())
+
+
+def get_tagger(path: Path) -> Tagger:
+    return TAGGERS[path.suffix.lower()](path)
 
-    # Find book and chapter based on track number
-    idx = track.tags['trkn']
-    while isinstance(idx, Iterable):
-        idx = idx[0]
-    book, chapter = book_chapters[idx - 1]
+
+def plan_track_change(path: Path, book_chapters: BookChapters) -> TrackChange | None:
+    """Get the changes needed for a track, or None if it's already tagged and named"""
+    try:
+        tagger = get_tagger(path)
+        # Find book and chapter based on track number
+        idx = tagger.track_number
+        book, chapter = book_chapters[idx - 1]
+    except (MutagenError, KeyError, IndexError, ValueError) as e:
+        logger.warning(f'Skipping {path}: no valid track number ({e!r})')
+        return None
     title = f'{book} Chapter {chapter}'
+    new_path = path.parent / f'{idx:0>4} - {title}{path.suffix}'
+
+    write_tags = not tagger.matches(title, book)
+    if not write_tags and path == new_path:
+        return None
+    return TrackChange(str(path), str(new_path), title, book, write_tags)
+
+
+def plan_changes(
+    paths: list[Path], book_chapters: BookChapters, workers: int = WORKERS
+) -> list[TrackChange]:
+    """Read tags from all tracks, and get the changes needed for any that aren't up to date"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        changes = executor.map(lambda p: plan_track_change(p, book_chapters), paths)
+        return [change for change in changes if change]
+
+
+def apply_change(change: TrackChange):
+    """Write metadata for a track, and rename it"""
+    path, new_path = Path(change.path), Path(change.new_path)
+    if change.write_tags:
+        get_tagger(path).write(change.title, change.group)
+    if path != new_path:
+        logger.info(f'Moving {path.name} to {new_path.name}')
+        path.rename(new_path)
 
-    # Write metadata
-    track.tags['©nam'] = title
-    track.tags['©grp'] = book
-    track.save()
 
-    # Rename
-    new_path = path.parent / f'{idx:0>4} - {title}.m4a'
-    logger.info(f'Moving {path.name} to {new_path.name}')
-    path.rename(new_path)
+def load_journal(path: Path = JOURNAL) -> list[TrackChange]:
+    """Get planned changes from an interrupted run that haven't been completed yet"""
+    if not path.is_file():
+        return []
+    changes, done = [], set()
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if 'done' in entry:
+                done.add(entry['done'])
+            else:
+                changes.append(TrackChange(**entry))
+    return [
+        c
+        for c in changes
+        if c.path not in done and not (c.path != c.new_path and Path(c.new_path).exists())
+    ]
+
+
+def apply_changes(changes: list[TrackChange], workers: int = WORKERS, journal: Path = JOURNAL):
+    """Apply changes in parallel. Each change is recorded in the journal as it completes, and the
+    journal is removed once all changes are done.
+    """
+    n_errors = 0
+    with open(journal, 'w') as f, ThreadPoolExecutor(max_workers=workers) as executor:
+        for change in changes:
+            f.write(json.dumps(asdict(change)) + '\n')
+        f.flush()
+
+        futures = {executor.submit(apply_change, change): change for change in changes}
+        for future in as_completed(futures):
+            change = futures[future]
+            try:
+                future.result()
+            except (MutagenError, OSError) as e:
+                logger.error(f'Failed to update {change.path}: {e}')
+                n_errors += 1
+            else:
+                f.write(json.dumps({'done': change.path}) + '\n')
+                f.flush()
+
+    if n_errors:
+        logger.warning(f'{n_errors} tracks failed; rerun to retry')
+    else:
+        journal.unlink()
 
 
 def main():
-    book_chapters = get_book_chapters()
-    logger.info(f'Found {len(book_chapters)} track names')
-    paths = list(AUDIO_DIR.glob('*'))
-    logger.info(f'Found {len(paths)} audio files')
-    for track_path in paths:
-        write_track_name(track_path, book_chapters)
+    parser = argparse.ArgumentParser(description='Add book/chapter metadata to audio Bible tracks')
+    parser.add_argument(
+        'audio_dir',
+        nargs='?',
+        type=Path,
+        default=AUDIO_DIR,
+        help=f'Directory of audio files, including subdirectories ({", ".join(TAGGERS)})',
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=WORKERS,
+        help=f'Max concurrent files (default: {WORKERS})',
+    )
+    parser.add_argument(
+        '-n', '--dry-run', action='store_true', help='Show planned changes without applying them'
+    )
+    args = parser.parse_args()
+
+    if changes := load_journal():
+        logger.info(f'Resuming {len(changes)} changes from {JOURNAL}')
+    else:
+        book_chapters = get_book_chapters()
+        logger.info(f'Found {len(book_chapters)} track names')
+        paths = find_tracks(args.audio_dir)
+        logger.info(f'Found {len(paths)} audio files')
+        changes = plan_changes(paths, book_chapters, args.workers)
+        logger.info(f'{len(paths) - len(changes)} tracks are already up to date or skipped')
+
+    if args.dry_run:
+        for change in changes:
+            logger.info(f'{Path(change.path).name} -> {Path(change.new_path).name}')
+    elif changes:
+        apply_changes(changes, args.workers)
 
 
 if __name__ == '__main__':
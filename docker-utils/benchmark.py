@@ -0,0 +1,315 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "platformdirs",
+#     "python-dateutil",
+#     "python-dotenv",
+#     "pyyaml",
+#     "requests",
+#     "requests-cache",
+# ]
+# ///
+"""Benchmark get_container_tags against a local fake registry, with simulated network latency"""
+
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from multiprocessing import get_context
+from pathlib import Path
+from resource import RUSAGE_SELF, getrusage
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable
+
+import docker_compose
+import get_container_tags as gct
+from fake_registry import FakeRegistry, synthetic_tags, tag_created
+
+
+def fetch_oci(registry: FakeRegistry) -> list[gct.Tag]:
+    tags = gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake')
+    return list(gct.resolve_timestamps(tags))
+
+
+def fetch_dockerhub(registry: FakeRegistry) -> list[gct.Tag]:
+    gct.DOCKERHUB_API_URL = f'{registry.url}/v2'
+    return list(gct.fetch_dockerhub_tags('org/image'))
+
+
+def fetch_gitlab(registry: FakeRegistry) -> list[gct.Tag]:
+    gct.GITLAB_API_URL = f'{registry.url}/api/v4'
+    tags = gct.fetch_gitlab_tags('registry.gitlab.com/group/project')
+    return list(gct.resolve_timestamps(tags))
+
+
+def _use_dockerhub(registry: FakeRegistry):
+    gct.DOCKERHUB_API_URL = f'{registry.url}/v2'
+
+
+def _use_ghcr(registry: FakeRegistry):
+    gct.GH_API_TOKEN = None
+    gct.GHCR_URL, gct.GHCR_TOKEN_URL = registry.url, registry.token_url
+
+
+def _use_gitlab(registry: FakeRegistry):
+    gct.GITLAB_API_URL = f'{registry.url}/api/v4'
+
+
+def _use_quay(registry: FakeRegistry):
+    gct.QUAY_API_URL = f'{registry.url}/api/v1'
+
+
+def _use_ecr(registry: FakeRegistry):
+    gct.ECR_API_URL = registry.url
+
+
+# Registry name: (repo, function to point the registry's API URLs at the fake registry)
+REGISTRIES: dict[str, tuple[str, Callable[[FakeRegistry], None]]] = {
+    'dockerhub': ('org/image', _use_dockerhub),
+    'ghcr': ('ghcr.io/org/image', _use_ghcr),
+    'gitlab': ('registry.gitlab.com/group/project', _use_gitlab),
+    'quay': ('quay.io/org/image', _use_quay),
+    'ecr': ('public.ecr.aws/org/image', _use_ecr),
+}
+SIZES = [10, 1000, 20000]
+SUITES = ['tags', 'workers', 'async', 'registries', 'revalidate', 'compose']
+
+
+def reset(workers: int = gct.WORKERS):
+    """Start with a cold cache and index"""
+    gct.session = gct.create_session(backend='memory')
+    gct.TOKENS = gct.TokenCache()
+    gct.INDEX = gct.TagIndex(':memory:')
+    gct.configure(workers=workers)
+
+
+def bench_workers(
+    name: str,
+    fetch: Callable[[FakeRegistry], list[gct.Tag]],
+    n_tags: int,
+    latency: float,
+    workers: list[int],
+):
+    """Measure wall time to fetch tags + timestamps from a registry with a cold cache"""
+    print(f'\n{name}: {n_tags} tags, {latency * 1000:.0f}ms latency')
+    print(f'{"workers":>8} {"requests":>9} {"seconds":>8} {"speedup":>8}')
+    baseline = None
+    for n_workers in workers:
+        with FakeRegistry(n_tags=n_tags, latency=latency) as registry:
+            reset(n_workers)
+            start = perf_counter()
+            tags = fetch(registry)
+            elapsed = perf_counter() - start
+        assert all(t.ts for t in tags)
+        baseline = baseline or elapsed
+        print(
+            f'{n_workers:>8} {registry.request_count:>9} {elapsed:>8.2f} '
+            f'{baseline / elapsed:>7.1f}x'
+        )
+
+
+def bench_sync_vs_async(n_repos: int, n_tags: int, latency: float, workers: int):
+    """Compare fetching multiple repos one at a time vs. all at once on a single event loop"""
+    print(f'\nGitLab registry: {n_repos} repos x {n_tags} tags, {latency * 1000:.0f}ms latency')
+    print(f'{"engine":>8} {"requests":>9} {"seconds":>8} {"speedup":>8}')
+    repos = [f'registry.gitlab.com/group/project_{i}' for i in range(n_repos)]
+
+    async def fetch_all():
+        return await asyncio.gather(*(gct.fetch_tags_async(repo) for repo in repos))
+
+    baseline = None
+    for engine in ['sync', 'async']:
+        with FakeRegistry(n_tags=n_tags, latency=latency) as registry:
+            reset(workers)
+            gct.GITLAB_API_URL = f'{registry.url}/api/v4'
+            start = perf_counter()
+            if engine == 'sync':
+                results = [gct.fetch_tags(repo) for repo in repos]
+            else:
+                results = gct.run_async(fetch_all())
+            elapsed = perf_counter() - start
+        assert all(len(tags) == n_tags for tags in results)
+        baseline = baseline or elapsed
+        print(
+            f'{engine:>8} {registry.request_count:>9} {elapsed:>8.2f} {baseline / elapsed:>7.1f}x'
+        )
+
+
+def _fetch_tags_case(
+    name: str, n_tags: int, latency: float, workers: int, limit: int | None = None
+) -> tuple[int, float, int]:
+    """Run ``fetch_tags()`` once against a fake registry, and get the number of requests, wall time,
+    and increase in peak RSS (KiB). Intended to run in a fresh process, so memory isn't inflated
+    by previous runs.
+    """
+    repo, use_registry = REGISTRIES[name]
+    with FakeRegistry(n_tags=n_tags, latency=latency) as registry:
+        reset(workers)
+        use_registry(registry)
+        rss_before = getrusage(RUSAGE_SELF).ru_maxrss
+        start = perf_counter()
+        tags = gct.fetch_tags(repo, limit=limit)
+        elapsed = perf_counter() - start
+        rss_increase = getrusage(RUSAGE_SELF).ru_maxrss - rss_before
+    assert len(tags) == min(limit or n_tags, n_tags)
+    return registry.request_count, elapsed, rss_increase
+
+
+def bench_registries(
+    registries: list[str],
+    sizes: list[int],
+    latency: float,
+    workers: int,
+    limit: int | None = None,
+):
+    """Measure requests, wall time, and peak memory for ``fetch_tags()`` per registry, with a cold
+    cache and index. Each case runs in a separate process. Memory includes the fake registry's
+    per-request allocations (but not its synthetic data, which is created beforehand).
+    """
+    print(f'\nfetch_tags(limit={limit}): {latency * 1000:.0f}ms latency, {workers} workers')
+    print(f'{"registry":>10} {"tags":>7} {"requests":>9} {"seconds":>8} {"peak MB":>8}')
+    for name in registries:
+        for n_tags in sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                future = executor.submit(_fetch_tags_case, name, n_tags, latency, workers, limit)
+                n_requests, elapsed, rss_increase = future.result()
+            print(
+                f'{name:>10} {n_tags:>7} {n_requests:>9} {elapsed:>8.2f} {rss_increase / 1024:>8.1f}'
+            )
+
+
+def bench_revalidate(registries: list[str], n_tags: int, latency: float, limit: int | None = None):
+    """Compare requests and response bytes for fetching tags with a cold cache vs. after the tag
+    list has expired (with conditional requests)
+    """
+    print(f'\nRevalidation: {n_tags} tags, {latency * 1000:.0f}ms latency')
+    print(f'{"registry":>10} {"run":>8} {"requests":>9} {"304s":>6} {"KB sent":>8} {"seconds":>8}')
+    for name in registries:
+        repo, use_registry = REGISTRIES[name]
+        with FakeRegistry(n_tags=n_tags, latency=latency) as registry:
+            reset()
+            use_registry(registry)
+            for run in ['cold', 'expired']:
+                if run == 'expired':
+                    gct.INDEX.conn.execute('UPDATE repos SET updated = 0')
+                    gct.session.cache.reset_expiration(timedelta(seconds=-1))
+                n_requests, n_bytes = registry.request_count, registry.bytes_sent
+                n_not_modified = registry.not_modified_count
+                start = perf_counter()
+                gct.fetch_tags(repo, limit=limit)
+                elapsed = perf_counter() - start
+                print(
+                    f'{name:>10} {run:>8} {registry.request_count - n_requests:>9} '
+                    f'{registry.not_modified_count - n_not_modified:>6} '
+                    f'{(registry.bytes_sent - n_bytes) / 1024:>8.1f} {elapsed:>8.2f}'
+                )
+
+
+def bench_tag_processing(n_tags: int, repeat: int = 3):
+    """Measure CPU time to filter, sort, and format a large tag list, with cold vs. cached Tags"""
+    names = synthetic_tags(n_tags)
+    # Mix in some pre-releases and tags that should be ignored
+    names += [f'{name}-rc.1' for name in names[::10]] + [f'{name}-arm64' for name in names[::10]]
+    tags = [gct.Tag(name, ts=tag_created(i)) for i, name in enumerate(names)]
+    print(f'\nTag processing: {len(tags)} tags')
+    print(f'{"pass":>8} {"seconds":>8}')
+
+    for i in range(repeat):
+        start = perf_counter()
+        filtered = [t for t in tags if not t.is_ignored]
+        filtered.sort(key=gct._version_key)
+        lines = [str(t) for t in filtered]
+        elapsed = perf_counter() - start
+        print(f'{"cold" if i == 0 else "cached":>8} {elapsed:>8.3f}')
+    assert len(lines) == n_tags + n_tags // 10
+
+
+def bench_compose_scan(n_files: int, n_services: int = 20):
+    """Measure time to scan a directory tree of compose files, with and without a process pool,
+    and with a cached result for every file
+    """
+    print(f'\nCompose scan: {n_files} files x {n_services} services')
+    print(f'{"run":>8} {"seconds":>8}')
+    with TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir) / 'stacks'
+        for i in range(n_files):
+            stack_dir = root / f'group_{i % 10}' / f'stack_{i}'
+            stack_dir.mkdir(parents=True)
+            services = ''.join(
+                f'  svc_{j}:\n    image: org/image_{(i + j) % 50}:1.{j}\n'
+                '    environment:\n      LOG_LEVEL: info\n    restart: unless-stopped\n'
+                for j in range(n_services)
+            )
+            (stack_dir / 'compose.yaml').write_text(f'services:\n{services}')
+
+        cache = docker_compose.ComposeCache(Path(tmp_dir) / 'compose_images.db')
+        for run, workers, refresh in [
+            ('serial', 1, True),
+            ('parallel', None, True),
+            ('cached', 1, False),
+        ]:
+            start = perf_counter()
+            compose_files = docker_compose.scan_images(root, cache, workers, refresh)
+            inventory = docker_compose.get_inventory(compose_files, root)
+            elapsed = perf_counter() - start
+            assert sum(u.count for u in inventory) == n_files * n_services
+            print(f'{run:>8} {elapsed:>8.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--n-tags', type=int, default=200, help='Number of tags')
+    parser.add_argument(
+        '-l', '--latency', type=float, default=0.02, help='Simulated latency per request (s)'
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help='Worker counts'
+    )
+    parser.add_argument(
+        '-r', '--n-repos', type=int, default=20, help='Number of repos for sync vs. async'
+    )
+    parser.add_argument(
+        '-t', '--n-synthetic', type=int, default=50000, help='Number of tags for tag processing'
+    )
+    parser.add_argument(
+        '-g',
+        '--registries',
+        nargs='+',
+        choices=REGISTRIES,
+        default=list(REGISTRIES),
+        help='Registries to benchmark with fetch_tags()',
+    )
+    parser.add_argument(
+        '-z', '--sizes', type=int, nargs='+', default=SIZES, help='Repo sizes for fetch_tags()'
+    )
+    parser.add_argument(
+        '-k', '--limit', type=int, help='Only fetch the N newest versions with fetch_tags()'
+    )
+    parser.add_argument(
+        '-c', '--n-compose', type=int, default=500, help='Number of compose files to scan'
+    )
+    parser.add_argument(
+        '-s', '--suites', nargs='+', choices=SUITES, default=SUITES, help='Benchmarks to run'
+    )
+    args = parser.parse_args()
+
+    if 'tags' in args.suites:
+        bench_tag_processing(args.n_synthetic)
+    if 'workers' in args.suites:
+        bench_workers('OCI registry', fetch_oci, args.n_tags, args.latency, args.workers)
+        bench_workers('Docker Hub', fetch_dockerhub, args.n_tags * 10, args.latency, args.workers)
+        bench_workers('GitLab registry', fetch_gitlab, args.n_tags, args.latency, args.workers)
+    if 'async' in args.suites:
+        bench_sync_vs_async(args.n_repos, args.n_tags // 10, args.latency, max(args.workers))
+    if 'registries' in args.suites:
+        bench_registries(args.registries, args.sizes, args.latency, max(args.workers), args.limit)
+    if 'revalidate' in args.suites:
+        bench_revalidate(args.registries, max(args.sizes), args.latency, args.limit)
+    if 'compose' in args.suites:
+        bench_compose_scan(args.n_compose)
+
+
+if __name__ == '__main__':
+    main()
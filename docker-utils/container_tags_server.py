@@ -0,0 +1,276 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "platformdirs",
+#     "python-dateutil",
+#     "python-dotenv",
+#     "pyyaml",
+#     "requests",
+#     "requests-cache",
+# ]
+# ///
+"""Long-running server for container update checks. Periodically refreshes tags for images in
+docker-compose files, keeps them in memory, and serves them over HTTP on a local port or Unix
+socket.
+
+Endpoints:
+    GET /status: Current vs. newest tags for all images
+    GET /tags/<repo>?limit=N: All known tags for a repository, sorted by version
+    GET /health: Refresh times and errors for each repository
+
+Example:
+    $ container_tags_server.py -c docker-compose.yml -s /tmp/container-tags.sock
+    $ curl --unix-socket /tmp/container-tags.sock http://localhost/status
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import basicConfig, getLogger
+from pathlib import Path
+from random import uniform
+from socketserver import BaseServer, ThreadingMixIn, UnixStreamServer
+from threading import Thread
+from time import time
+from urllib.parse import parse_qs, unquote, urlparse
+
+import get_container_tags as gct
+import requests
+from docker_compose import ServiceImage
+
+# Default time between refreshes of each repo, +/- a random fraction to spread out requests
+REFRESH_INTERVAL = gct.TAG_LIST_EXPIRATION.total_seconds()
+REFRESH_JITTER = 0.1
+MAX_PER_HOST = 4
+
+logger = getLogger(__name__)
+
+
+@dataclass
+class RepoState:
+    """Most recently fetched tags for a repository"""
+
+    tags: list[gct.Tag] = field(default_factory=list)  # Sorted by version
+    tags_json: list[dict] = field(default_factory=list)
+    updated: float | None = None
+    error: str | None = None
+
+
+def _tag_json(tag: gct.Tag | None) -> dict | None:
+    if tag is None:
+        return None
+    return {'name': tag.name, 'created': tag.ts, 'digest': tag.digest}
+
+
+class TagServer:
+    """Keeps tags for a set of images up to date, and answers queries from memory.
+
+    Each repo is refreshed on its own schedule, every ``interval`` seconds +/- ``jitter`` (as a
+    fraction of the interval), so requests for many repos don't all happen at once. Responses are
+    serialized after each refresh, so queries don't need to do any work other than a dict lookup.
+    """
+
+    def __init__(
+        self,
+        images: list[ServiceImage],
+        interval: float = REFRESH_INTERVAL,
+        jitter: float = REFRESH_JITTER,
+    ):
+        self.images = images
+        self.interval = interval
+        self.jitter = jitter
+        self.current_tags: dict[str, set[str]] = {}
+        for image in images:
+            self.current_tags.setdefault(gct.normalize_repo(image.name), set()).add(image.tag)
+        self.repos = {repo: RepoState() for repo in self.current_tags}
+        self.responses: dict[str, bytes] = {}
+        self._update_responses()
+
+    async def refresh(self, repo: str):
+        """Re-fetch the tag list for a repo, and resolve timestamps for the current + newest tags"""
+        state = self.repos[repo]
+        try:
+            tags = await asyncio.to_thread(gct.fetch_sorted_tags, repo, True)
+            selected = gct.select_current_and_newest(tags, self.current_tags[repo])
+            await gct.resolve_timestamps_async(selected)
+            gct.get_index().update_timestamps(repo, selected)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f'Failed to refresh tags for {repo}: {e}')
+            state.error = str(e)
+        # Anything else is unexpected, but shouldn't stop refreshes for this or any other repo
+        except Exception as e:
+            logger.exception(f'Unexpected error refreshing tags for {repo}')
+            state.error = f'{type(e).__name__}: {e}'
+        else:
+            self.repos[repo] = RepoState(tags, [_tag_json(t) for t in tags], time())
+        self._update_responses(repo)
+
+    async def refresh_all(self):
+        """Refresh all repos at once"""
+        try:
+            await asyncio.to_thread(gct.prefetch_tokens, self.repos)
+        except requests.RequestException as e:
+            logger.warning(f'Failed to fetch shared token; falling back to per-repo tokens: {e}')
+        await asyncio.gather(*(self.refresh(repo) for repo in self.repos))
+
+    async def run(self):
+        """Refresh all repos, then keep refreshing each one on a jittered schedule"""
+        await self.refresh_all()
+        await asyncio.gather(*(self._refresh_loop(repo) for repo in self.repos))
+
+    async def _refresh_loop(self, repo: str):
+        while True:
+            await asyncio.sleep(self.interval * uniform(1 - self.jitter, 1 + self.jitter))
+            await self.refresh(repo)
+
+    def get_statuses(self) -> list[gct.ImageStatus]:
+        """Get current vs. newest tags for all images, from the most recently fetched tags"""
+        statuses = []
+        for image in self.images:
+            state = self.repos[gct.normalize_repo(image.name)]
+            status = gct.ImageStatus(
+                image.service, image.name, current=gct.Tag(image.tag), pinned_digest=image.digest
+            )
+            status.current = next((t for t in state.tags if t.name == image.tag), status.current)
+            status.newest = gct.newest_matching(state.tags, image.tag)
+            status.error = state.error
+            statuses.append(status)
+        return statuses
+
+    def query(self, path: str) -> tuple[int, bytes]:
+        """Get the status code and JSON response for a request path"""
+        url = urlparse(path)
+        if url.path.startswith('/tags/'):
+            repo = gct.normalize_repo(unquote(url.path.removeprefix('/tags/')))
+            if repo not in self.repos:
+                return 404, b'{"error": "unknown repository"}'
+            try:
+                limit = int(parse_qs(url.query).get('limit', [0])[0])
+            except ValueError:
+                limit = -1
+            if limit < 0:
+                return 400, b'{"error": "limit must be a non-negative integer"}'
+            if limit:
+                return 200, json.dumps(self.repos[repo].tags_json[-limit:]).encode()
+            return 200, self.responses[f'/tags/{repo}']
+        response = self.responses.get(url.path)
+        return (200, response) if response is not None else (404, b'{"error": "not found"}')
+
+    def _update_responses(self, repo: str | None = None):
+        statuses = [
+            {
+                'service': s.service,
+                'repo': s.repo,
+                'current': _tag_json(s.current),
+                'newest': _tag_json(s.newest),
+                'outdated': s.is_outdated,
+                'error': s.error,
+            }
+            for s in self.get_statuses()
+        ]
+        health = {r: {'updated': s.updated, 'error': s.error} for r, s in self.repos.items()}
+        for r in [repo] if repo else self.repos:
+            self.responses[f'/tags/{r}'] = json.dumps(self.repos[r].tags_json).encode()
+        self.responses['/status'] = json.dumps(statuses).encode()
+        self.responses['/health'] = json.dumps(health).encode()
+
+    def serve(self, port: int | None = None, socket_path: Path | None = None) -> BaseServer:
+        """Start serving queries in a background thread, on either a local TCP port or a Unix
+        socket
+        """
+        tag_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = socket_path is None
+
+            def do_GET(self):
+                status, content = tag_server.query(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def address_string(self) -> str:
+                return str(self.client_address or socket_path)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        if socket_path:
+            socket_path.unlink(missing_ok=True)
+            server: BaseServer = UnixHTTPServer(str(socket_path), Handler)
+            os.chmod(socket_path, 0o600)
+        else:
+            server = ThreadingHTTPServer(('127.0.0.1', port or 0), Handler)
+            server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '-c',
+        '--compose',
+        type=Path,
+        action='append',
+        required=True,
+        help='docker-compose file with images to check (may be specified multiple times)',
+    )
+    listen = parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument('-p', '--port', type=int, help='Local TCP port to listen on')
+    listen.add_argument('-s', '--socket', type=Path, help='Unix socket path to listen on')
+    parser.add_argument(
+        '-i',
+        '--interval',
+        type=float,
+        default=REFRESH_INTERVAL,
+        help=f'Seconds between refreshes of each repo (default: {REFRESH_INTERVAL:.0f})',
+    )
+    parser.add_argument(
+        '-j',
+        '--jitter',
+        type=float,
+        default=REFRESH_JITTER,
+        help=f'Random variation in refresh interval, as a fraction (default: {REFRESH_JITTER})',
+    )
+    parser.add_argument(
+        '-m',
+        '--max-per-host',
+        type=int,
+        default=MAX_PER_HOST,
+        help=f'Max concurrent requests to each registry (default: {MAX_PER_HOST})',
+    )
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose logging')
+    args = parser.parse_args()
+    basicConfig(level='INFO' if args.verbose else 'WARNING')
+    gct.configure(max_per_host=args.max_per_host)
+
+    images = gct.load_images([], args.compose)
+    tag_server = TagServer(images, interval=args.interval, jitter=args.jitter)
+    server = tag_server.serve(port=args.port, socket_path=args.socket)
+    logger.info(
+        f'Checking {len(images)} images; listening on {args.socket or server.server_address}'
+    )
+    try:
+        gct.run_async(tag_server.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        if args.socket:
+            args.socket.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+"""A local fake container registry with synthetic tags, for offline tests and benchmarks.
+Serves the OCI Distribution API, and the tag APIs for Docker Hub, GitLab, Quay, and ECR Public.
+
+Example:
+    >>> with FakeRegistry(n_tags=100, latency=0.01) as registry:
+    ...     tags = list(_fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake'))
+"""
+
+import json
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from time import sleep
+from typing import Iterator
+from urllib.parse import parse_qs, urlparse
+
+OCI_MANIFEST = 'application/vnd.oci.image.manifest.v1+json'
+OCI_INDEX = 'application/vnd.oci.image.index.v1+json'
+DOCKER_MANIFEST = 'application/vnd.docker.distribution.manifest.v2+json'
+DOCKER_MANIFEST_LIST = 'application/vnd.docker.distribution.manifest.list.v2+json'
+# Platforms for multi-arch images. Each platform's image is built 30 minutes after the previous one.
+PLATFORMS = ['linux/amd64', 'linux/arm64/v8']
+START_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def synthetic_tags(n_tags: int) -> list[str]:
+    """Get a list of version-like tag names, e.g. '1.0.0', '1.0.1', ..."""
+    return [f'{i // 100}.{i // 10 % 10}.{i % 10}' for i in range(n_tags)]
+
+
+def synthetic_aliases(versions: list[str]) -> dict[str, str]:
+    """Get alias tags for the latest patch of each minor version, plus 'latest', e.g.
+    ``{'1.0': '1.0.9', ..., 'latest': '2.4.9'}``
+    """
+    aliases = {version.rsplit('.', 1)[0]: version for version in versions}
+    aliases['latest'] = versions[-1]
+    return aliases
+
+
+def tag_created(idx: int, platform: str = PLATFORMS[0]) -> str:
+    """Get a deterministic created timestamp for the synthetic tag at a given index"""
+    offset = timedelta(minutes=30 * PLATFORMS.index(platform))
+    return (START_DATE + timedelta(hours=idx) + offset).isoformat()
+
+
+def tag_modified_rfc2822(idx: int) -> str:
+    """Get the same timestamp as ``tag_created()``, in the RFC 2822 format used by Quay"""
+    return format_datetime(START_DATE + timedelta(hours=idx))
+
+
+def _digest(content: str) -> str:
+    return f'sha256:{sha256(content.encode()).hexdigest()}'
+
+
+class FakeRegistry:
+    """Threaded HTTP server that implements the subset of registry APIs used by
+    ``get_container_tags``, with a configurable per-request latency to simulate network delay.
+    Every third tag is served as a multi-arch image, alternating between OCI image indexes and
+    Docker manifest lists, each with an attestation manifest listed first (like ``docker buildx``
+    creates). Single-arch images are linux/amd64. OCI endpoints require a bearer token
+    from ``/token``, and tokens can be revoked to simulate expiration.
+
+    Args:
+        n_tags: Number of synthetic version tags to serve
+        latency: Delay in seconds before each response
+        page_size: Default number of tags per page of tag list results
+        throttle_every: Respond to every Nth GitLab tag detail request with a 429
+        aliases: Also serve alias tags that point to the same image as a version tag
+    """
+
+    def __init__(
+        self,
+        n_tags: int = 100,
+        latency: float = 0.0,
+        page_size: int = 100,
+        throttle_every: int = 0,
+        aliases: bool = False,
+    ):
+        self.versions = synthetic_tags(n_tags)
+        self.version_idx = {version: i for i, version in enumerate(self.versions)}
+        # All tag names, and the version tag each one points to
+        self.targets = {version: version for version in self.versions}
+        if aliases:
+            self.targets.update(synthetic_aliases(self.versions))
+        self.tags = list(self.targets)
+        self.tag_idx = {tag: i for i, tag in enumerate(self.tags)}
+
+        self.manifests = {version: self._manifest(version) for version in self.versions}
+        self.digests = {version: _digest(json.dumps(m)) for version, m in self.manifests.items()}
+        self.manifest_digests = {digest: version for version, digest in self.digests.items()}
+        self.child_digests = {
+            _digest(f'child:{v}:{p}'): (v, p) for v in self.versions for p in PLATFORMS
+        }
+        self.config_digests = {
+            _digest(f'config:{v}:{p}'): (v, p) for v in self.versions for p in PLATFORMS
+        }
+        self.latency = latency
+        self.page_size = page_size
+        self.throttle_every = throttle_every
+        self.request_count = 0
+        self.token_requests: list[dict] = []
+        self.throttled_count = 0
+        self.not_modified_count = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self.bytes_sent = 0
+        self._valid_tokens: set[str] = set()
+        self._detail_count = 0
+        self._responding = Event()
+        self._responding.set()
+        self._hold_timeout = 0.0
+        self._lock = Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def token_url(self) -> str:
+        return f'{self.url}/token'
+
+    def revoke_tokens(self):
+        """Invalidate all previously issued tokens"""
+        with self._lock:
+            self._valid_tokens.clear()
+
+    def move_tag(self, tag: str, version: str):
+        """Point an existing tag to the image for a different version, e.g. to update 'latest'"""
+        with self._lock:
+            self.targets[tag] = version
+
+    @contextmanager
+    def hold_responses(self, timeout: float = 5) -> Iterator[None]:
+        """Receive requests, but don't respond until the block exits (or after ``timeout``
+        seconds), e.g. to check that a client doesn't wait for a response
+        """
+        self._hold_timeout = timeout
+        self._responding.clear()
+        try:
+            yield
+        finally:
+            self._responding.set()
+
+    def __enter__(self) -> 'FakeRegistry':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                # Track max concurrent requests while they're being processed (i.e., before sending
+                # a response)
+                with registry._lock:
+                    registry.request_count += 1
+                    registry._in_flight += 1
+                    registry.max_in_flight = max(registry.max_in_flight, registry._in_flight)
+                if registry.latency:
+                    sleep(registry.latency)
+                with registry._lock:
+                    registry._in_flight -= 1
+                registry._responding.wait(registry._hold_timeout)
+                registry._route(self)
+
+            do_HEAD = do_GET
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _route(self, request: BaseHTTPRequestHandler):
+        url = urlparse(request.path)
+        params = parse_qs(url.query)
+        path = url.path
+
+        if path == '/token':
+            return self._send_token(request, params)
+        if not path.startswith('/v2/') or path.startswith('/v2/repositories/'):
+            return self._route_tag_api(request, path, params)
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if token not in self._valid_tokens:
+            return self._send(request, {'errors': ['unauthorized']}, status=401)
+
+        base, _, ref = path.rpartition('/')
+        if path.endswith('/tags/list'):
+            return self._send_tag_list(request, path, params)
+        elif base.endswith('/manifests'):
+            return self._send_manifest(request, ref)
+        elif base.endswith('/blobs'):
+            return self._send_blob(request, ref)
+        return self._send(request, {'errors': ['not found']}, status=404)
+
+    def _route_tag_api(self, request, path: str, params: dict):
+        """Route requests for registry-specific (non-OCI) tag APIs"""
+        if path.startswith('/api/v4/projects/'):
+            return self._route_gitlab(request, path, params)
+        if path.startswith('/v2/repositories/') and path.endswith('/tags'):
+            return self._send_dockerhub_tag_list(request, path, params)
+        if path.startswith('/api/v1/repository/') and path.endswith('/tag/'):
+            return self._send_quay_tag_list(request, params)
+        if path == '/describeImageTags' and request.command == 'POST':
+            body = json.loads(request.rfile.read(int(request.headers['Content-Length'])))
+            return self._send_ecr_tag_list(request, body)
+        return self._send(request, {'errors': ['not found']}, status=404)
+
+    def _send_token(self, request, params: dict):
+        with self._lock:
+            self.token_requests.append(params)
+            token = f'token-{len(self.token_requests)}'
+            self._valid_tokens.add(token)
+        self._send(request, {'token': token, 'expires_in': 300})
+
+    def _route_gitlab(self, request, path: str, params: dict):
+        base, _, ref = path.rpartition('/')
+        if path.endswith('/registry/repositories'):
+            return self._send(request, [{'id': 1, 'path': path}])
+        elif path.endswith('/registry/repositories/1/tags'):
+            return self._send_gitlab_tag_list(request, path, params)
+        elif base.endswith('/registry/repositories/1/tags'):
+            return self._send_gitlab_tag(request, ref)
+        return self._send(request, {'message': '404 Not Found'}, status=404)
+
+    def _send_gitlab_tag_list(self, request, path: str, params: dict):
+        per_page = int(params.get('per_page', [self.page_size])[0])
+        page = int(params.get('page', [1])[0])
+        start = (page - 1) * per_page
+        headers = {}
+        if start + per_page < len(self.tags):
+            headers['Link'] = f'<{self.url}{path}?per_page={per_page}&page={page + 1}>; rel="next"'
+        body = [
+            {'name': tag, 'path': f'{path}:{tag}'} for tag in self.tags[start : start + per_page]
+        ]
+        self._send(request, body, headers=headers)
+
+    def _send_gitlab_tag(self, request, tag: str):
+        with self._lock:
+            self._detail_count += 1
+            throttle = self.throttle_every and self._detail_count % self.throttle_every == 0
+            self.throttled_count += bool(throttle)
+        if throttle:
+            return self._send(
+                request, {'message': '429 Too Many Requests'}, 429, {'Retry-After': '0'}
+            )
+        if tag not in self.targets:
+            return self._send(request, {'message': '404 Tag Not Found'}, status=404)
+        created = tag_created(self.version_idx[self.targets[tag]])
+        self._send(
+            request, {'name': tag, 'created_at': created, 'digest': self._manifest_digest(tag)}
+        )
+
+    def _send_dockerhub_tag_list(self, request, path: str, params: dict):
+        # Like Docker Hub, return the most recent tags first, and at most 100 per page
+        page_size = min(int(params.get('page_size', [self.page_size])[0]), 100)
+        page = int(params.get('page', [1])[0])
+        start = (page - 1) * page_size
+        tags = self.tags[::-1][start : start + page_size]
+        next_url = None
+        if start + page_size < len(self.tags):
+            next_url = f'{self.url}{path}?page_size={page_size}&page={page + 1}'
+        results = [
+            {
+                'name': tag,
+                'last_updated': tag_created(self.version_idx[self.targets[tag]]),
+                'digest': self._manifest_digest(tag),
+            }
+            for tag in tags
+        ]
+        self._send(request, {'count': len(self.tags), 'next': next_url, 'results': results})
+
+    def _send_quay_tag_list(self, request, params: dict):
+        limit = min(int(params.get('limit', [50])[0]), 100)
+        page = int(params.get('page', [1])[0])
+        start = (page - 1) * limit
+        results = [
+            {
+                'name': tag,
+                'last_modified': tag_modified_rfc2822(self.version_idx[self.targets[tag]]),
+                'manifest_digest': self._manifest_digest(tag),
+            }
+            for tag in self.tags[::-1][start : start + limit]
+        ]
+        has_additional = start + limit < len(self.tags)
+        self._send(request, {'tags': results, 'page': page, 'has_additional': has_additional})
+
+    def _send_ecr_tag_list(self, request, body: dict):
+        max_results = min(int(body.get('maxResults', 100)), 1000)
+        start = int(body.get('nextToken') or 0)
+        results = [
+            {
+                'imageTag': tag,
+                'createdAt': tag_created(self.version_idx[self.targets[tag]]),
+                'imageDetail': {'imageDigest': self._manifest_digest(tag)},
+            }
+            for tag in self.tags[start : start + max_results]
+        ]
+        response: dict = {'imageTagDetails': results}
+        if start + max_results < len(self.tags):
+            response['nextToken'] = str(start + max_results)
+        self._send(request, response)
+
+    def _manifest_digest(self, tag: str) -> str:
+        return self.digests[self.targets[tag]]
+
+    def _send_tag_list(self, request, path: str, params: dict):
+        n = int(params.get('n', [self.page_size])[0])
+        last = params.get('last', [None])[0]
+        start = self.tag_idx[last] + 1 if last in self.tag_idx else 0
+        page = self.tags[start : start + n]
+        headers = {}
+        if start + n < len(self.tags):
+            headers['Link'] = f'<{path}?n={n}&last={page[-1]}>; rel="next"'
+        self._send(request, {'name': path, 'tags': page}, headers=headers)
+
+    def _send_manifest(self, request, ref: str):
+        # Manifest referenced by digest: either a top-level manifest, or child of an image index
+        if ref in self.child_digests:
+            version, platform = self.child_digests[ref]
+            manifest = self._image_manifest(version, platform, self._child_type(version))
+        elif ref in self.manifest_digests:
+            manifest = self.manifests[self.manifest_digests[ref]]
+        elif ref in self.targets:
+            manifest = self.manifests[self.targets[ref]]
+        else:
+            return self._send(request, {'errors': ['unknown manifest']}, status=404)
+        digest = _digest(json.dumps(manifest))
+        self._send(request, manifest, headers={'Docker-Content-Digest': digest})
+
+    def _send_blob(self, request, digest: str):
+        if digest not in self.config_digests:
+            return self._send(request, {'errors': ['unknown blob']}, status=404)
+        version, platform = self.config_digests[digest]
+        created = tag_created(self.version_idx[version], platform)
+        self._send(request, {'created': created, 'os': 'linux'})
+
+    def _manifest(self, version: str) -> dict:
+        idx = self.version_idx[version]
+        if idx % 6 == 0:
+            return self._image_index(version, OCI_INDEX)
+        elif idx % 6 == 3:
+            return self._image_index(version, DOCKER_MANIFEST_LIST)
+        return self._image_manifest(version)
+
+    def _child_type(self, version: str) -> str:
+        return DOCKER_MANIFEST if self.version_idx[version] % 6 == 3 else OCI_MANIFEST
+
+    def _image_manifest(
+        self, tag: str, platform: str = PLATFORMS[0], media_type: str = OCI_MANIFEST
+    ) -> dict:
+        return {
+            'mediaType': media_type,
+            'config': {'digest': _digest(f'config:{tag}:{platform}')},
+            'layers': [],
+        }
+
+    def _image_index(self, tag: str, media_type: str) -> dict:
+        child_type = self._child_type(tag)
+        attestation = {
+            'digest': _digest(f'attestation:{tag}'),
+            'mediaType': child_type,
+            'platform': {'os': 'unknown', 'architecture': 'unknown'},
+        }
+        children = []
+        for platform in PLATFORMS:
+            os, arch, *variant = platform.split('/')
+            children.append(
+                {
+                    'digest': _digest(f'child:{tag}:{platform}'),
+                    'mediaType': child_type,
+                    'platform': {'os': os, 'architecture': arch}
+                    | ({'variant': variant[0]} if variant else {}),
+                }
+            )
+        return {'mediaType': media_type, 'manifests': [attestation, *children]}
+
+    def _send(self, request, body: dict | list, status: int = 200, headers: dict | None = None):
+        """Send a JSON response. Successful GET responses include an ETag, and conditional requests
+        with a matching ETag get an empty 304 response.
+        """
+        content = json.dumps(body).encode()
+        content_type = body.get('mediaType') if isinstance(body, dict) else None
+        headers = headers or {}
+        if status == 200 and request.command != 'POST':
+            headers['ETag'] = f'"{sha256(content).hexdigest()[:16]}"'
+            if request.headers.get('If-None-Match') == headers['ETag']:
+                status, content = 304, b''
+        with self._lock:
+            self.not_modified_count += status == 304
+            self.bytes_sent += len(content) if request.command != 'HEAD' else 0
+
+        request.send_response(status)
+        request.send_header('Content-Type', content_type or 'application/json')
+        request.send_header('Content-Length', str(len(content)))
+        for k, v in headers.items():
+            request.send_header(k, v)
+        request.end_headers()
+        if request.command != 'HEAD':
+            request.wfile.write(content)
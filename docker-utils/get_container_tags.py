@@ -3,29 +3,66 @@
 # requires-python = ">=3.10"
 # dependencies = [
 #     "python-dateutil",
+#     "platformdirs",
 #     "python-dotenv",
+#     "pyyaml",
 #     "requests",
 #     "requests-cache",
 # ]
 # ///
 import argparse
+import fnmatch
+import heapq
 import re
-from dataclasses import dataclass
-from datetime import timedelta
-from fnmatch import fnmatch
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+from hashlib import sha256
+from itertools import chain, islice
 from logging import basicConfig, getLogger
 from os import getenv
 from pathlib import Path
-from typing import Iterator
+from threading import BoundedSemaphore, Lock
+from time import monotonic, sleep, time
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Iterable, Iterator, TypeVar
+from urllib.parse import urlparse
 
-import requests
-from dateutil.parser import parse as parse_date
 from dotenv import load_dotenv
-from requests_cache import NEVER_EXPIRE, CachedSession
+from platformdirs import user_cache_dir
+
+if TYPE_CHECKING:
+    import requests
+    from docker_compose import ServiceImage
+    from requests_cache import CachedSession
 
 load_dotenv(Path(__file__).resolve().parent / '.env')
 DT_FORMAT = '%Y-%m-%d'
+INDEX_PATH = Path(user_cache_dir()) / 'container_tags.db'
+# How long to use a tag list from the cache or index before re-fetching from the registry
+TAG_LIST_EXPIRATION = timedelta(hours=1)
+# How long past expiration to keep using a cached tag list while it's revalidated in the background
+MAX_STALENESS: timedelta | None = None
+# Max rows to read or write at a time, when streaming tags to/from the index
+INDEX_CHUNK_SIZE = 500
 GH_API_TOKEN = getenv('GH_API_TOKEN')
+DOCKERHUB_API_URL = 'https://hub.docker.com/v2'
+DOCKERHUB_PAGE_SIZE = 100  # Max allowed by Docker Hub
+GITLAB_API_URL = 'https://gitlab.com/api/v4'
+QUAY_API_URL = 'https://quay.io/api/v1'
+QUAY_PAGE_SIZE = 100  # Max allowed by Quay
+ECR_API_URL = 'https://api.us-east-1.gallery.ecr.aws'
+ECR_PAGE_SIZE = 1000  # Max allowed by ECR Public
+# Base URLs, anonymous token endpoints, and service names for OCI registries
+GHCR_URL = 'https://ghcr.io'
+GHCR_TOKEN_URL, GHCR_SERVICE = 'https://ghcr.io/token', 'ghcr.io'
+CODEBERG_URL = 'https://codeberg.org'
+CODEBERG_TOKEN_URL, CODEBERG_SERVICE = 'https://codeberg.org/v2/token', 'container_registry'
+# Refresh tokens this many seconds before they expire, and max repos to request per token
+TOKEN_EXPIRY_MARGIN = 10
+MAX_TOKEN_SCOPES = 20
 IGNORE_TAGS = [
     'sha256-*',
     'sha-*',
@@ -37,37 +74,537 @@ IGNORE_TAGS = [
     '*arm32*',
     '*arm64*',
 ]
+IGNORE_PATTERN = re.compile('|'.join(fnmatch.translate(pattern) for pattern in IGNORE_TAGS))
 
-logger = getLogger(__name__)
-session = CachedSession(
-    'container_registries.db',
-    use_cache_dir=True,
-    allowable_methods=['GET', 'POST'],
-    urls_expire_after={
-        '*/v2/*/manifests/*': NEVER_EXPIRE,
-        '*/v2/*/blobs/*': NEVER_EXPIRE,
-        'gitlab.com/api/v4/projects/*/registry/repositories/*/tags/*': NEVER_EXPIRE,
-        '*': timedelta(hours=1),
-    },
+# Version tags, with optional semver/PEP 440 pre-release and post-release segments, e.g.:
+# "1.25.3", "v2.0.0-rc.1", "3.12b2", "1.0.post1", or "9-alpine" (variant suffixes are ignored)
+VERSION_PATTERN = re.compile(
+    r'[vV]?(?P<release>\d+(?:\.\d+)*)'
+    r'(?:[-_.]?(?P<pre>dev|alpha|a|beta|b|preview|pre|rc|c)(?![a-zA-Z])[-_.]?(?P<pre_n>\d+)?)?'
+    r'(?:[-_.]?post[-_.]?(?P<post_n>\d+))?',
+    re.IGNORECASE,
 )
+# Version numbers within a variant suffix, e.g. "3.19" in "1.25.3-alpine3.19"
+VARIANT_VERSION_PATTERN = re.compile(r'\d+(?:\.\d+)*')
+PRE_RELEASE_PHASES = {
+    'dev': 0,
+    'a': 1,
+    'alpha': 1,
+    'b': 2,
+    'beta': 2,
+    'c': 3,
+    'pre': 3,
+    'preview': 3,
+    'rc': 3,
+}
+FINAL_PHASE = 4
+# Sort key: (release segments, pre-release phase, pre-release number, post-release number)
+VersionKey = tuple[tuple[int, ...], int, int, int]
+
+# Max concurrent requests for per-tag lookups, and max requests per second to a single host
+WORKERS = 8
+RATE_LIMIT: float | None = None
+MAX_PER_HOST: int | None = None
+# Platform (os/arch[/variant]) to get timestamps for from multi-arch images, or None for the first
+PLATFORM: str | None = None
+# Manifest media types to accept, and which ones are multi-arch indexes
+OCI_INDEX = 'application/vnd.oci.image.index.v1+json'
+DOCKER_MANIFEST_LIST = 'application/vnd.docker.distribution.manifest.list.v2+json'
+MANIFEST_TYPES = [
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+    OCI_INDEX,
+    DOCKER_MANIFEST_LIST,
+]
+logger = getLogger(__name__)
+T = TypeVar('T')
+R = TypeVar('R')
 
 
-@dataclass
+class RateLimiter:
+    """Spaces out requests to each host to stay under a rate limit, and optionally caps the number
+    of concurrent requests, overall and to each host
+    """
+
+    def __init__(
+        self,
+        rate_limit: float | None = None,
+        max_per_host: int | None = None,
+        max_concurrent: int | None = None,
+    ):
+        self.interval = 1 / rate_limit if rate_limit else 0
+        self.max_per_host = max_per_host
+        self._next_request: dict[str, float] = {}
+        self._host_slots: dict[str, BoundedSemaphore] = {}
+        self._slots: AbstractContextManager = (
+            BoundedSemaphore(max_concurrent) if max_concurrent else nullcontext()
+        )
+        self._lock = Lock()
+
+    @contextmanager
+    def limit(self, host: str) -> Iterator[None]:
+        """Wait until a request can be sent to this host, and hold a slot until it's done"""
+        with self._slots, self._slot(host):
+            if self.interval:
+                self._wait(host)
+            yield
+
+    def _slot(self, host: str) -> AbstractContextManager:
+        """Get a semaphore for this host, if concurrent requests are capped"""
+        if not self.max_per_host:
+            return nullcontext()
+        with self._lock:
+            return self._host_slots.setdefault(host, BoundedSemaphore(self.max_per_host))
+
+    def _wait(self, host: str):
+        """Reserve the next available time slot for this host, and sleep until then"""
+        with self._lock:
+            now = monotonic()
+            start = max(now, self._next_request.get(host, now))
+            self._next_request[host] = start + self.interval
+        if start > now:
+            sleep(start - now)
+
+
+def create_session(**kwargs) -> 'CachedSession':
+    """Create a cached session for registry requests. Manifests and blobs fetched by digest (which
+    are content-addressed) are cached forever. Tag lists, and anything else looked up by tag name
+    (which can be moved to a different image), are cached for an hour. Bearer tokens are never
+    cached here, since ``TokenCache`` handles their expiration.
+
+    Expired tag lists are kept in the cache, and if the registry sent an ``ETag`` or
+    ``Last-Modified`` header, they're revalidated with a conditional request. If unchanged, the
+    registry responds with an empty 304 and the cached response is reused.
+    """
+    from requests_cache import DO_NOT_CACHE, NEVER_EXPIRE, CachedSession
+
+    return CachedSession(
+        'container_registries.db',
+        use_cache_dir=True,
+        allowable_methods=['GET', 'POST'],
+        urls_expire_after={
+            re.compile(r'/token\?'): DO_NOT_CACHE,
+            '*/v2/*/manifests/sha256:*': NEVER_EXPIRE,
+            '*/v2/*/blobs/*': NEVER_EXPIRE,
+            '*': TAG_LIST_EXPIRATION,
+        },
+        **kwargs,
+    )
+
+
+def configure(
+    workers: int = WORKERS,
+    rate_limit: float | None = RATE_LIMIT,
+    platform: str | None = PLATFORM,
+    max_staleness: timedelta | None = MAX_STALENESS,
+    max_per_host: int | None = MAX_PER_HOST,
+):
+    """Set the number of concurrent requests, per-host rate limit (requests per second), platform
+    for multi-arch images, how long to use expired tag lists while revalidating them, and max
+    concurrent requests per registry host
+    """
+    global WORKERS, RATE_LIMIT, PLATFORM, MAX_STALENESS, MAX_PER_HOST
+    WORKERS, RATE_LIMIT, PLATFORM = workers, rate_limit, platform
+    MAX_STALENESS, MAX_PER_HOST = max_staleness, max_per_host
+    if session is not None:
+        _configure_session(session)
+
+
+def _configure_session(session: 'CachedSession'):
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session.settings.stale_while_revalidate = MAX_STALENESS or False
+    # Requests are capped at WORKERS overall, since they can come from nested thread pools
+    # (e.g., concurrent Docker Hub pages for each of several concurrent repos)
+    limiter = RateLimiter(RATE_LIMIT, MAX_PER_HOST, WORKERS)
+
+    # Since this sits below the cache, responses served from the cache are not limited
+    class RateLimitedAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            with limiter.limit(urlparse(request.url).netloc):
+                return super().send(request, **kwargs)
+
+    # Retry rate-limited requests with exponential backoff, or after the server's Retry-After delay
+    retry = Retry(
+        total=5,
+        status_forcelist=[429],
+        backoff_factor=0.5,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    # Size the connection pool to match the number of workers, so connections get reused
+    adapter = RateLimitedAdapter(pool_connections=WORKERS, pool_maxsize=WORKERS, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def run_async(coro: Coroutine[Any, Any, R]) -> R:
+    """Run a coroutine on a new event loop. Blocking requests are run (via ``asyncio.to_thread``)
+    in a single pool of ``WORKERS`` threads. Requests made from any nested thread pools share the
+    session's limit of ``WORKERS`` concurrent requests, so concurrency is bounded across all repos
+    and tags.
+
+    If called while an event loop is already running (e.g., in a Jupyter notebook), the new loop
+    is run in a separate thread, and this blocks until it's done.
+    """
+    import asyncio
+
+    async def run() -> R:
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=WORKERS))
+        return await coro
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(run())
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, run()).result()
+
+
+def map_concurrent(func: Callable[[T], R], items: Iterable[T], ordered: bool = True) -> Iterator[R]:
+    """Apply a function to items using a bounded thread pool, yielding results in input order, or
+    in order of completion if ``ordered=False``
+    """
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        if ordered:
+            yield from executor.map(func, items)
+        else:
+            futures = [executor.submit(func, item) for item in items]
+            yield from (future.result() for future in as_completed(futures))
+
+
+@dataclass(frozen=True)
+class RegistryAuth:
+    """Parameters for an anonymous token exchange with an OCI registry"""
+
+    realm: str  # Token endpoint URL
+    service: str
+    scope: str
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {'Authorization': f'Bearer {TOKENS.get(self)}'}
+
+
+class TokenCache:
+    """Thread-safe cache of anonymous registry tokens, keyed by (token endpoint, scope).
+
+    Tokens are reused across repositories and requests until shortly before they expire, based on
+    the ``expires_in`` value from the token response. A token for multiple scopes can also be
+    requested up front with ``fetch()``, for registries that support it.
+    """
+
+    def __init__(self):
+        self._tokens: dict[tuple[str, str], tuple[str, float]] = {}
+        self._locks: dict[tuple[str, str], Lock] = {}
+        self._lock = Lock()
+
+    def get(self, auth: RegistryAuth) -> str:
+        """Get a cached token, or fetch a new one if it's missing or expired"""
+        key = (auth.realm, auth.scope)
+        with self._lock:
+            key_lock = self._locks.setdefault(key, Lock())
+        # Only one thread per scope should fetch a new token; others wait and reuse it
+        with key_lock:
+            token, expires = self._tokens.get(key, (None, 0.0))
+            if token and monotonic() < expires:
+                return token
+            return self.fetch(auth.realm, auth.service, [auth.scope])
+
+    def fetch(self, realm: str, service: str, scopes: list[str]) -> str:
+        """Fetch a new token for one or more scopes, and cache it for each scope"""
+        response = get_session().get(realm, params={'service': service, 'scope': scopes})
+        response.raise_for_status()
+        token_json = response.json()
+        token = token_json.get('token') or token_json['access_token']
+        # Per the Docker token spec, tokens are valid for 60 seconds if not otherwise specified
+        expires = monotonic() + int(token_json.get('expires_in') or 60) - TOKEN_EXPIRY_MARGIN
+        with self._lock:
+            self._tokens.update({(realm, scope): (token, expires) for scope in scopes})
+        return token
+
+    def invalidate(self, auth: RegistryAuth, token: str):
+        """Remove a token that was rejected by the registry, unless another thread has already
+        replaced it
+        """
+        key = (auth.realm, auth.scope)
+        with self._lock:
+            if self._tokens.get(key, (None,))[0] == token:
+                del self._tokens[key]
+
+
+# The shared session and tag index are created on first use, so startup (e.g., for --help) doesn't
+# need to import requests-cache or open any databases
+session: 'CachedSession | None' = None
+INDEX: 'TagIndex | None' = None
+TOKENS = TokenCache()
+_init_lock = Lock()
+
+
+def get_session() -> 'CachedSession':
+    """Get the shared session, and create it if needed"""
+    global session
+    with _init_lock:
+        if session is None:
+            session = create_session()
+            _configure_session(session)
+    return session
+
+
+def get_index() -> 'TagIndex':
+    """Get the shared tag index, and open it if needed"""
+    global INDEX
+    with _init_lock:
+        if INDEX is None:
+            INDEX = TagIndex(INDEX_PATH)
+    return INDEX
+
+
+@dataclass(slots=True)
 class Tag:
     name: str
     ts: str | None = None
+    digest: str | None = None
+    # For registries that don't include timestamps in tag lists: a function to look it up later
+    resolver: Callable[[], tuple[str | None, str | None]] | None = field(
+        default=None, repr=False, compare=False
+    )
+    # True if the resolver has already been called, even if it didn't find a timestamp
+    resolved: bool = field(default=False, repr=False, compare=False)
+    # Other tags that point to the same image digest
+    aliases: list[str] = field(default_factory=list, repr=False, compare=False)
+    # Cached values derived from the name and timestamp, since these get checked repeatedly
+    _ignored: bool | None = field(default=None, init=False, repr=False, compare=False)
+    _version: VersionKey | None = field(default=None, init=False, repr=False, compare=False)
+    _date: tuple[str | None, str] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     @property
     def date(self) -> str:
-        return parse_date(self.ts).strftime(DT_FORMAT) if self.ts else ''
+        if self._date is None or self._date[0] != self.ts:
+            self._date = (self.ts, _format_date(self.ts) if self.ts else '')
+        return self._date[1]
+
+    @property
+    def is_ignored(self) -> bool:
+        if self._ignored is None:
+            self._ignored = IGNORE_PATTERN.match(self.name) is not None
+        return self._ignored
+
+    @property
+    def version(self) -> VersionKey:
+        if self._version is None:
+            self._version = _parse_version(self.name)
+        return self._version
 
     @property
-    def is_ignored(self):
-        return any(fnmatch(self.name, pat) for pat in IGNORE_TAGS)
+    def is_prerelease(self) -> bool:
+        return self.version[1] < FINAL_PHASE
+
+    @property
+    def is_unresolved(self) -> bool:
+        """Check if this tag needs a separate lookup to get its timestamp"""
+        return (
+            self.ts is None
+            and not self.resolved
+            and self.resolver is not None
+            and not self.is_ignored
+        )
+
+    def resolve(self) -> 'Tag':
+        """Look up the timestamp (and digest, if available) for this tag, if needed"""
+        if self.is_unresolved:
+            self.ts, digest = self.resolver()  # type: ignore[misc]
+            self.digest = self.digest or digest
+            self.resolved = True
+        return self
 
     def __str__(self) -> str:
+        alias_str = f' ({", ".join(self.aliases)})' if self.aliases else ''
         date_str = f' - {self.date}' if self.date else ''
-        return f'{self.name}{date_str}'
+        return f'{self.name}{alias_str}{date_str}'
+
+
+# Only use indexed timestamps that were resolved for the current platform
+_CREATED_FOR_PLATFORM = "CASE WHEN coalesce(platform, '') = ? THEN created END"
+_RESOLVED_FOR_PLATFORM = "CASE WHEN coalesce(platform, '') = ? THEN resolved END"
+
+
+class TagIndex:
+    """Persistent SQLite index of tag metadata (registry, repo, tag, digest, created timestamp).
+
+    Tag lists are re-fetched after ``TAG_LIST_EXPIRATION``. If the tag list includes digests,
+    timestamps are kept across updates, so only new tags (or tags whose digest has changed) need to
+    be resolved again. Otherwise, indexed timestamps are also kept, and only a forced refresh
+    (``recheck=True``) looks up each tag's current digest again, in case it's been moved to a
+    different image. A recently updated repo can be answered entirely from the index, without any
+    HTTP requests. Tags that were resolved without finding a timestamp
+    (e.g., an image config without a ``created`` date) are marked as resolved, so they aren't
+    looked up again on every query.
+
+    Timestamps depend on the platform chosen for multi-arch images, so they're only reused for the
+    same platform. The platform-specific child manifest and timestamp for each multi-arch image
+    are also saved, so they don't need to be looked up again for other tags of the same image.
+    """
+
+    def __init__(self, path: Path | str):
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self.conn:
+            self.conn.executescript(
+                'CREATE TABLE IF NOT EXISTS repos (repo TEXT PRIMARY KEY, updated REAL NOT NULL);'
+                'CREATE TABLE IF NOT EXISTS tags ('
+                '  registry TEXT, repo TEXT, name TEXT, digest TEXT, created TEXT, seen REAL,'
+                '  platform TEXT,'
+                '  PRIMARY KEY (repo, name)'
+                ');'
+            )
+            # Index manifest digest + platform -> platform-specific child manifest + timestamp
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS manifests ('
+                '  digest TEXT, platform TEXT, child TEXT, created TEXT,'
+                '  PRIMARY KEY (digest, platform)'
+                ')'
+            )
+            # Add columns missing from indexes created by previous versions
+            columns = [row[1] for row in self.conn.execute('PRAGMA table_info(tags)')]
+            for column in ['seen REAL', 'platform TEXT', 'resolved INTEGER']:
+                if column.split()[0] not in columns:
+                    self.conn.execute(f'ALTER TABLE tags ADD COLUMN {column}')
+
+    def is_fresh(self, repo: str, max_age: timedelta = TAG_LIST_EXPIRATION) -> bool:
+        """Check if a repo's tag list has been updated recently"""
+        with self._lock:
+            row = self.conn.execute('SELECT updated FROM repos WHERE repo = ?', (repo,)).fetchone()
+        return bool(row) and time() - row[0] <= max_age.total_seconds()
+
+    def get_tags(self, repo: str, max_age: timedelta = TAG_LIST_EXPIRATION) -> list[Tag] | None:
+        """Get all indexed tags for a repo, or ``None`` if it hasn't been updated recently"""
+        return list(self.iter_tags(repo)) if self.is_fresh(repo, max_age) else None
+
+    def iter_tags(self, repo: str) -> Iterator[Tag]:
+        """Iterate over indexed tags for a repo, reading ``INDEX_CHUNK_SIZE`` rows at a time"""
+        last = ''
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    f'SELECT name, {_CREATED_FOR_PLATFORM}, digest, {_RESOLVED_FOR_PLATFORM} '
+                    'FROM tags WHERE repo = ? AND name > ? ORDER BY name LIMIT ?',
+                    (PLATFORM or '', PLATFORM or '', repo, last, INDEX_CHUNK_SIZE),
+                ).fetchall()
+            yield from (
+                Tag(name=name, ts=created, digest=digest, resolved=bool(resolved))
+                for name, created, digest, resolved in rows
+            )
+            if len(rows) < INDEX_CHUNK_SIZE:
+                return
+            last = rows[-1][0]
+
+    def update_tags(self, repo: str, tags: Iterable[Tag]):
+        """Replace the tag list for a repo. Any previously resolved timestamps are copied to the new
+        tags, unless their digest has changed.
+        """
+        for _ in self.write_tags(repo, tags):
+            pass
+
+    def write_tags(self, repo: str, tags: Iterable[Tag], recheck: bool = False) -> Iterator[Tag]:
+        """Streaming version of ``update_tags()``: tags are written (and yielded) in chunks as they
+        are consumed, and the repo is only marked as updated once all tags have been written.
+
+        Timestamps for tags without a digest in the tag list are copied from the index unless
+        ``recheck=True``. Tags that were resolved without a timestamp are always resolved again.
+        """
+        registry = _get_registry(repo)
+        started = time()
+        for chunk in _chunked(tags, INDEX_CHUNK_SIZE):
+            with self._lock, self.conn:
+                names = [tag.name for tag in chunk]
+                known = {
+                    name: (created, digest, resolved)
+                    for name, created, digest, resolved in self.conn.execute(
+                        f'SELECT name, {_CREATED_FOR_PLATFORM}, digest, {_RESOLVED_FOR_PLATFORM} '
+                        f'FROM tags WHERE repo = ? AND name IN ({",".join("?" * len(names))})',
+                        (PLATFORM or '', PLATFORM or '', repo, *names),
+                    )
+                }
+                for tag in chunk:
+                    created, digest, resolved = known.get(tag.name, (None, None, None))
+                    # Without a digest from the tag list, there's no way to tell if the tag has
+                    # moved, so only check it again if requested
+                    if tag.ts is None and (
+                        tag.digest == digest
+                        if tag.digest
+                        else not tag.resolver or (created is not None and not recheck)
+                    ):
+                        tag.ts, tag.digest, tag.resolved = created, digest, bool(resolved)
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO tags '
+                    '(registry, repo, name, digest, created, seen, platform, resolved) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [
+                        (
+                            registry,
+                            repo,
+                            t.name,
+                            t.digest,
+                            t.ts,
+                            started,
+                            PLATFORM or '',
+                            t.resolved,
+                        )
+                        for t in chunk
+                    ],
+                )
+            yield from chunk
+
+        # Remove any tags that weren't in the new list
+        with self._lock, self.conn:
+            self.conn.execute(
+                'DELETE FROM tags WHERE repo = ? AND (seen IS NULL OR seen < ?)', (repo, started)
+            )
+            self.conn.execute('INSERT OR REPLACE INTO repos VALUES (?, ?)', (repo, started))
+
+    def update_timestamps(self, repo: str, tags: Iterable[Tag]):
+        """Save newly resolved timestamps, and mark tags that were resolved without one"""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'UPDATE tags SET created = ?, digest = coalesce(?, digest), platform = ?, '
+                'resolved = ? WHERE repo = ? AND name = ?',
+                [
+                    (t.ts, t.digest, PLATFORM or '', t.resolved, repo, t.name)
+                    for t in tags
+                    if t.ts or t.resolved
+                ],
+            )
+
+    def get_manifest(self, digest: str, platform: str | None) -> tuple[str | None, str | None]:
+        """Get the child manifest digest (for multi-arch images) and timestamp for a manifest"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT child, created FROM manifests WHERE digest = ? AND platform = ?',
+                (digest, platform or ''),
+            ).fetchone()
+        return row or (None, None)
+
+    def update_manifest(
+        self, digest: str, platform: str | None, child: str | None, created: str | None
+    ):
+        """Save the child manifest digest and/or timestamp for a manifest"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO manifests VALUES (?, ?, ?, ?)',
+                (digest, platform or '', child, created),
+            )
+
+
+def _chunked(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
 
 
 def fetch_dockerhub_tags(repo) -> Iterator[Tag]:
@@ -78,14 +615,20 @@ def fetch_dockerhub_tags(repo) -> Iterator[Tag]:
     else:
         org = 'library'
 
-    url = f'https://hub.docker.com/v2/repositories/{org}/{repo}/tags?page_size=100'
-    while url:
-        response = session.get(url)
+    url = f'{DOCKERHUB_API_URL}/repositories/{org}/{repo}/tags?page_size={DOCKERHUB_PAGE_SIZE}'
+
+    def fetch_page(page: int) -> list[dict]:
+        response = get_session().get(f'{url}&page={page}')
         response.raise_for_status()
-        tags_json = response.json().get('results', [])
-        for item in tags_json:
-            yield Tag(name=item['name'], ts=item.get('last_updated'))
-        url = response.json().get('next')
+        return response.json()
+
+    # The first page includes the total count, so the remaining pages can be fetched concurrently
+    first_page = fetch_page(1)
+    n_pages = -(-first_page.get('count', 0) // DOCKERHUB_PAGE_SIZE)
+    pages = chain([first_page], map_concurrent(fetch_page, range(2, n_pages + 1)))
+    for page_json in pages:
+        for item in page_json.get('results', []):
+            yield Tag(name=item['name'], ts=item.get('last_updated'), digest=item.get('digest'))
 
 
 def fetch_ghcr_tags(repo: str) -> Iterator[Tag]:
@@ -97,12 +640,11 @@ def fetch_ghcr_tags(repo: str) -> Iterator[Tag]:
     path = repo.replace('ghcr.io/', '')
 
     if not GH_API_TOKEN:
-        token_url = f'https://ghcr.io/token?service=ghcr.io&scope=repository:{path}:pull'
-        yield from _fetch_oci_tags(host='https://ghcr.io', path=path, token_url=token_url)
+        yield from _fetch_oci_tags(GHCR_URL, path, GHCR_TOKEN_URL, GHCR_SERVICE)
         return
 
     org, image = path.split('/', 1)
-    response = session.get(
+    response = get_session().get(
         f'https://api.github.com/orgs/{org}/packages/container/{image}/versions',
         headers={
             'Authorization': f'Bearer {GH_API_TOKEN}',
@@ -112,52 +654,67 @@ def fetch_ghcr_tags(repo: str) -> Iterator[Tag]:
     response.raise_for_status()
     for item in response.json():
         for tag in item.get('metadata', {}).get('container', {}).get('tags', []):
-            yield Tag(name=tag, ts=item.get('created_at'))
+            yield Tag(name=tag, ts=item.get('created_at'), digest=item.get('name'))
 
 
 def fetch_quay_tags(repo: str) -> Iterator[Tag]:
     """Fetch tags from Quay.io"""
     repo = repo.replace('quay.io/', '')
-    response = session.get(f'https://quay.io/api/v1/repository/{repo}/tag/')
-    response.raise_for_status()
-    yield from (
-        Tag(name=item['name'], ts=item.get('last_modified'))
-        for item in response.json().get('tags', [])
-    )
+    url = f'{QUAY_API_URL}/repository/{repo}/tag/?onlyActiveTags=true&limit={QUAY_PAGE_SIZE}'
+    page, has_additional = 1, True
+    while has_additional:
+        response = get_session().get(f'{url}&page={page}')
+        response.raise_for_status()
+        page_json = response.json()
+        yield from (
+            Tag(name=item['name'], ts=item.get('last_modified'), digest=item.get('manifest_digest'))
+            for item in page_json.get('tags', [])
+        )
+        page, has_additional = page + 1, page_json.get('has_additional', False)
 
 
 def fetch_ecr_tags(repo: str) -> Iterator[Tag]:
     """Fetch tags from Amazon ECR Public"""
     registry, repo = repo.replace('public.ecr.aws/', '').split('/')
-    response = session.post(
-        'https://api.us-east-1.gallery.ecr.aws/describeImageTags',
-        json={'registryAliasName': registry, 'repositoryName': repo},
-    )
-    response.raise_for_status()
-    yield from (
-        Tag(name=i['imageTag'], ts=i['createdAt']) for i in response.json()['imageTagDetails']
-    )
+    params = {'registryAliasName': registry, 'repositoryName': repo, 'maxResults': ECR_PAGE_SIZE}
+    next_token = None
+    while True:
+        response = get_session().post(
+            f'{ECR_API_URL}/describeImageTags',
+            json={**params, 'nextToken': next_token} if next_token else params,
+        )
+        response.raise_for_status()
+        page_json = response.json()
+        yield from (
+            Tag(
+                name=i['imageTag'],
+                ts=i['createdAt'],
+                digest=i.get('imageDetail', {}).get('imageDigest'),
+            )
+            for i in page_json['imageTagDetails']
+        )
+        if not (next_token := page_json.get('nextToken')):
+            break
 
 
 def fetch_codeberg_tags(repo: str) -> Iterator[Tag]:
     """Fetch tags from Codeberg (Forgejo) container registry using OCI Distribution Spec"""
     path = repo.replace('codeberg.org/', '')  # e.g. "owner/image"
     # Codeberg requires a Bearer token even for public images (anonymous token exchange)
-    token_url = (
-        f'https://codeberg.org/v2/token?service=container_registry&scope=repository:{path}:pull'
-    )
-    yield from _fetch_oci_tags(host='https://codeberg.org', path=path, token_url=token_url)
+    yield from _fetch_oci_tags(CODEBERG_URL, path, CODEBERG_TOKEN_URL, CODEBERG_SERVICE)
 
 
 def fetch_gitlab_tags(repo: str) -> Iterator[Tag]:
-    """Fetch tags from GitLab Container Registry via GitLab REST API"""
+    """Fetch tags from GitLab Container Registry via GitLab REST API. Timestamps require a separate
+    request per tag, so they're fetched later by ``resolve_timestamps()``.
+    """
     # repo format: registry.gitlab.com/group/project[/image]
     path = repo.replace('registry.gitlab.com/', '')  # e.g. "group/project"
     encoded_path = path.replace('/', '%2F')
-    base = f'https://gitlab.com/api/v4/projects/{encoded_path}/registry/repositories'
+    base = f'{GITLAB_API_URL}/projects/{encoded_path}/registry/repositories'
 
     # Find the registry repository ID
-    response = session.get(base)
+    response = get_session().get(base)
     response.raise_for_status()
     repos = response.json()
     if not repos:
@@ -166,42 +723,48 @@ def fetch_gitlab_tags(repo: str) -> Iterator[Tag]:
 
     # Paginate tags via Link header
     url: str | None = f'{base}/{repo_id}/tags?per_page=100'
-    tags = []
     while url:
-        response = session.get(url)
+        response = get_session().get(url)
         response.raise_for_status()
-        tags.extend(Tag(name=item['name']) for item in response.json())
+        for item in response.json():
+            name = item['name']
+            yield Tag(name=name, resolver=partial(_fetch_gitlab_timestamp, base, repo_id, name))
         link = response.headers.get('Link', '')
         url = next(
             (p.split(';')[0].strip().strip('<>') for p in link.split(',') if 'rel="next"' in p),
             None,
         )
 
-    # Fetch created_at per tag
-    n_printable = sum(1 for t in tags if not t.is_ignored)
-    logger.info(f'Fetching timestamps for {n_printable}/{len(tags)} tags')
-    for t in tags:
-        if not t.is_ignored:
-            detail = session.get(f'{base}/{repo_id}/tags/{t.name}')
-            t.ts = detail.json().get('created_at') if detail.ok else None
-        yield t
+
+def _fetch_gitlab_timestamp(base: str, repo_id: int, tag: str) -> tuple[str | None, str | None]:
+    """Get the created timestamp and digest for a GitLab tag from the tag details endpoint"""
+    detail = get_session().get(f'{base}/{repo_id}/tags/{tag}')
+    if not detail.ok:
+        return None, None
+    detail_json = detail.json()
+    return detail_json.get('created_at'), detail_json.get('digest')
 
 
-def _fetch_oci_tags(host: str, path: str, token_url: str) -> Iterator[Tag]:
-    """Fetch tags from an OCI-compatible registry using anonymous token exchange"""
-    token_resp = session.get(token_url)
-    token_resp.raise_for_status()
-    token = token_resp.json()['token']
-    auth_headers = {'Authorization': f'Bearer {token}'}
+def _fetch_oci_tags(host: str, path: str, realm: str, service: str) -> Iterator[Tag]:
+    """Fetch tags from an OCI-compatible registry using anonymous token exchange. Timestamps
+    require a manifest and config blob lookup per tag, so they're fetched later by
+    ``resolve_timestamps()``.
 
+    Args:
+        host: Registry base URL
+        path: Repository path, e.g. "owner/image"
+        realm: Token endpoint URL
+        service: Service name to request a token for
+    """
+    auth = RegistryAuth(realm=realm, service=service, scope=f'repository:{path}:pull')
     base = f'{host}/v2/{path}'
-    tags: list[Tag] = []
+    resolver = OCIResolver(base, auth)
     url: str | None = f'{base}/tags/list?n=100'
     while url:
-        response = session.get(url, headers=auth_headers)
+        response = _oci_get(url, auth)
         response.raise_for_status()
-        if response_tags := response.json().get('tags'):
-            tags.extend(Tag(name=t) for t in response_tags)
+        for name in response.json().get('tags') or []:
+            yield Tag(name=name, resolver=partial(resolver.resolve, name))
         # Pagination via Link header (may contain relative URLs)
         link = response.headers.get('Link', '')
         next_url = next(
@@ -210,58 +773,187 @@ def _fetch_oci_tags(host: str, path: str, token_url: str) -> Iterator[Tag]:
         )
         url = f'{host}{next_url}' if next_url and next_url.startswith('/') else next_url
 
-    n_printable = sum(1 for t in tags if not t.is_ignored)
-    logger.info(f'Fetching timestamps for {n_printable}/{len(tags)} tags')
-    for t in tags:
-        if not t.is_ignored:
-            t.ts = _fetch_oci_timestamp(base, t.name, auth_headers)
-        yield t
 
+def _oci_get(url: str, auth: RegistryAuth, method: str = 'GET', **headers) -> 'requests.Response':
+    """Send a request to an OCI registry with a bearer token. If the token is rejected (e.g.,
+    expired early or revoked), get a new one and retry once.
+    """
+    token = TOKENS.get(auth)
+    session = get_session()
+    response = session.request(method, url, headers={'Authorization': f'Bearer {token}', **headers})
+    if response.status_code == 401:
+        TOKENS.invalidate(auth, token)
+        response = session.request(method, url, headers={**auth.headers, **headers})
+    return response
 
-def _fetch_oci_timestamp(base: str, tag: str, auth_headers: dict) -> str | None:
-    """Get the created timestamp for an OCI tag via manifest -> config blob"""
-    try:
-        resp = session.get(
-            f'{base}/manifests/{tag}',
-            headers={
-                **auth_headers,
-                'Accept': 'application/vnd.oci.image.manifest.v1+json,application/vnd.oci.image.index.v1+json',
-            },
+
+class OCIResolver:
+    """Looks up timestamps for tags in an OCI repository. Tags often point to the same manifest
+    digest (e.g., '1.25', '1.25.3', and 'latest'), so each tag only needs a HEAD request to get its
+    current digest, and the manifest, config blob (and child manifest, for image indexes) are only
+    fetched once per unique digest.
+    """
+
+    def __init__(self, base: str, auth: RegistryAuth):
+        self.base = base
+        self.auth = auth
+        self._timestamps: dict[str, str | None] = {}
+        self._locks: dict[str, Lock] = {}
+        self._lock = Lock()
+
+    def resolve(self, tag: str) -> tuple[str | None, str | None]:
+        """Get the created timestamp and manifest digest for a tag"""
+        # HEAD requests aren't cached, so this always gets the image the tag currently points to
+        accept = ','.join(MANIFEST_TYPES)
+        resp = _oci_get(f'{self.base}/manifests/{tag}', self.auth, 'HEAD', Accept=accept)
+        if not resp.ok:
+            return None, None
+        digest = resp.headers.get('Docker-Content-Digest')
+        # If the registry doesn't provide it, the manifest digest is the hash of its content
+        if not digest:
+            resp = _oci_get(f'{self.base}/manifests/{tag}', self.auth, Accept=accept)
+            if not resp.ok:
+                return None, None
+            digest = f'sha256:{sha256(resp.content).hexdigest()}'
+
+        with self._lock:
+            digest_lock = self._locks.setdefault(digest, Lock())
+        with digest_lock:
+            if digest not in self._timestamps:
+                self._timestamps[digest] = self._fetch_timestamp(digest)
+        return self._timestamps[digest], digest
+
+    def _fetch_timestamp(self, digest: str) -> str | None:
+        """Get the created timestamp for a manifest from its config blob. For multi-arch images,
+        this uses the child manifest for the selected platform.
+        """
+        import requests
+
+        child, created = get_index().get_manifest(digest, PLATFORM)
+        if created:
+            return created
+
+        try:
+            manifest = self._fetch_manifest(digest)
+            if manifest.get('mediaType', '').split(';')[0] in (OCI_INDEX, DOCKER_MANIFEST_LIST):
+                child = child or _select_platform(manifest.get('manifests', []), PLATFORM)
+                if not child:
+                    logger.info(f'No {PLATFORM} image found for {digest}')
+                    return None
+                get_index().update_manifest(digest, PLATFORM, child, None)
+                manifest = self._fetch_manifest(child)
+            config_digest = manifest.get('config', {}).get('digest')
+            if not config_digest:
+                return None
+            blob_resp = _oci_get(f'{self.base}/blobs/{config_digest}', self.auth)
+            blob_resp.raise_for_status()
+            created = blob_resp.json().get('created')
+        except requests.HTTPError:
+            return None
+
+        get_index().update_manifest(digest, PLATFORM, child, created)
+        return created
+
+    def _fetch_manifest(self, digest: str) -> dict:
+        """Get a manifest by digest, with its media type from the response headers if it's not
+        included in the manifest itself
+        """
+        resp = _oci_get(
+            f'{self.base}/manifests/{digest}', self.auth, Accept=','.join(MANIFEST_TYPES)
         )
         resp.raise_for_status()
         manifest = resp.json()
-        # For multi-arch image indexes, resolve the first child manifest
-        if manifest.get('mediaType') == 'application/vnd.oci.image.index.v1+json':
-            sub_digest = (manifest.get('manifests') or [{}])[0].get('digest')
-            if not sub_digest:
-                return None
-            resp = session.get(f'{base}/manifests/{sub_digest}', headers=auth_headers)
-            resp.raise_for_status()
-            manifest = resp.json()
-        digest = manifest.get('config', {}).get('digest')
-        if not digest:
-            return None
-        blob_resp = session.get(f'{base}/blobs/{digest}', headers=auth_headers)
-        blob_resp.raise_for_status()
-        return blob_resp.json().get('created')
-    except requests.HTTPError:
-        return None
-
-
-def _version_key(tag: Tag) -> tuple[int, ...]:
-    name = tag.name.lstrip('vV')
-    parts = []
-    for part in name.split('.'):
-        # Strip non-numeric suffix from each segment (e.g. "9-alpine" → 9, "10b3" → 10)
-        numeric = re.match(r'^\d+', part)
-        if not numeric:
-            break
-        parts.append(int(numeric.group()))
-    return tuple(parts) if parts else (0,)
+        manifest.setdefault('mediaType', resp.headers.get('Content-Type', ''))
+        return manifest
+
+
+def _select_platform(manifests: list[dict], platform: str | None) -> str | None:
+    """Get the digest of the child manifest in an image index that matches a platform
+    (os/arch[/variant]), or the first one (excluding attestations) if no platform is specified
+    """
+    os, _, arch = (platform or '').partition('/')
+    arch, _, variant = arch.partition('/')
+    for child in manifests:
+        child_platform = child.get('platform', {})
+        # Build attestations are stored as children with an 'unknown/unknown' platform
+        if child_platform.get('os') == 'unknown':
+            continue
+        if not platform or (
+            child_platform.get('os') == os
+            and child_platform.get('architecture') == arch
+            and (not variant or child_platform.get('variant') == variant)
+        ):
+            return child.get('digest')
+    return None
+
+
+def _format_date(ts: str) -> str:
+    # Most registries return ISO 8601 timestamps, which are much faster to parse with the stdlib
+    try:
+        return datetime.fromisoformat(ts).strftime(DT_FORMAT)
+    except ValueError:
+        from dateutil.parser import parse as parse_date
+
+        return parse_date(ts).strftime(DT_FORMAT)
+
+
+def _version_key(tag: Tag) -> VersionKey:
+    return tag.version
+
+
+def _parse_version(name: str) -> VersionKey:
+    """Parse a tag name into a sort key. Pre-releases sort before their final release (dev < alpha
+    < beta < rc < final < post), and non-version tags (like "latest") sort first.
+    """
+    match = VERSION_PATTERN.match(name)
+    if not match:
+        return ((0,), FINAL_PHASE, 0, 0)
+    release = tuple(int(part) for part in match['release'].split('.'))
+    pre, pre_n, post_n = match['pre'], match['pre_n'], match['post_n']
+    phase = PRE_RELEASE_PHASES[pre.lower()] if pre else FINAL_PHASE
+    return (release, phase, int(pre_n or 0), int(post_n) + 1 if post_n else 0)
+
+
+def resolve_timestamps(tags: Iterable[Tag], ordered: bool = True) -> Iterator[Tag]:
+    """Concurrently look up timestamps for any tags that weren't listed with one. Tags are yielded
+    in their original order, or as soon as they're resolved if ``ordered=False``.
+    """
+    tags = list(tags)
+    n_unresolved = sum(1 for t in tags if t.is_unresolved)
+    if n_unresolved:
+        logger.info(f'Fetching timestamps for {n_unresolved}/{len(tags)} tags')
+    yield from map_concurrent(Tag.resolve, tags, ordered=ordered)
+
+
+def normalize_repo(repo: str) -> str:
+    """Normalize repository names that are aliases for another registry"""
+    return repo.replace('lscr.io/', 'ghcr.io/')
 
 
-def fetch_tags(repo: str) -> list[str]:
-    repo = repo.replace('lscr.io/', 'ghcr.io/')
+def _get_registry(repo: str) -> str:
+    """Get the registry host for a repository, e.g. 'ghcr.io' or 'docker.io' (if unspecified)"""
+    first, _, rest = repo.partition('/')
+    return first if rest and ('.' in first or ':' in first) else 'docker.io'
+
+
+def prefetch_tokens(repos: Iterable[str]):
+    """Fetch shared tokens for multiple ghcr.io repositories at once, instead of one per repo"""
+    if GH_API_TOKEN:
+        return
+    repos = [normalize_repo(repo) for repo in repos]
+    scopes = sorted(
+        {f'repository:{r.removeprefix("ghcr.io/")}:pull' for r in repos if r.startswith('ghcr.io/')}
+    )
+    if len(scopes) < 2:
+        return
+    logger.info(f'Fetching shared token for {len(scopes)} ghcr.io repositories')
+    for i in range(0, len(scopes), MAX_TOKEN_SCOPES):
+        TOKENS.fetch(GHCR_TOKEN_URL, GHCR_SERVICE, scopes[i : i + MAX_TOKEN_SCOPES])
+
+
+def fetch_repo_tags(repo: str) -> Iterator[Tag]:
+    """Get tags from the appropriate registry for a repository, without resolving timestamps"""
+    repo = normalize_repo(repo)
     if repo.startswith('ghcr.io/'):
         tags = fetch_ghcr_tags(repo)
     elif repo.startswith('quay.io/'):
@@ -274,19 +966,409 @@ def fetch_tags(repo: str) -> list[str]:
         tags = fetch_gitlab_tags(repo)
     else:
         tags = fetch_dockerhub_tags(repo)
-    tags = sorted(tags, key=_version_key)
-    return [str(tag) for tag in tags if not tag.is_ignored]
+    return tags
+
+
+def iter_repo_tags(repo: str, refresh: bool = False, recheck: bool | None = None) -> Iterator[Tag]:
+    """Iterate over non-ignored tags for a repository, unsorted, without resolving timestamps.
+
+    Tags are read from the local index if it's been updated recently. Otherwise (or if
+    ``refresh=True``) they're fetched from the registry a page at a time, and any previously
+    resolved timestamps are filled in from the index. For registries that don't list digests,
+    ``recheck=True`` (the default with ``refresh=True``) resolves tags again in case they've moved.
+    """
+    repo = normalize_repo(repo)
+    index = get_index()
+    if not refresh and index.is_fresh(repo):
+        return index.iter_tags(repo)
+    tags = (tag for tag in fetch_repo_tags(repo) if not tag.is_ignored)
+    return index.write_tags(repo, tags, refresh if recheck is None else recheck)
+
+
+def fetch_sorted_tags(repo: str, refresh: bool = False) -> list[Tag]:
+    """Get non-ignored tags for a repository, sorted by version, without resolving timestamps"""
+    return sorted(iter_repo_tags(repo, refresh), key=_version_key)
+
+
+def latest_tags(tags: Iterable[Tag], k: int) -> list[Tag]:
+    """Get the ``k`` highest versions, sorted by version, without holding more than ``k`` tags"""
+    return heapq.nlargest(k, tags, key=_version_key)[::-1]
+
+
+async def resolve_timestamps_async(tags: list[Tag]) -> list[Tag]:
+    """Look up timestamps for any tags that weren't listed with one, as tasks on the current event
+    loop. This allows per-tag lookups to overlap with other repos' tag list requests.
+    """
+    import asyncio
+
+    unresolved = [t for t in tags if t.is_unresolved]
+    if unresolved:
+        logger.info(f'Fetching timestamps for {len(unresolved)}/{len(tags)} tags')
+        await asyncio.gather(*(asyncio.to_thread(tag.resolve) for tag in unresolved))
+    return tags
+
+
+async def fetch_selected_tags_async(
+    repo: str,
+    select: Callable[[Iterable[Tag]], list[Tag]],
+    refresh: bool = False,
+    aliases: bool = False,
+    on_tag: Callable[[Tag], Any] | None = None,
+) -> list[Tag]:
+    """Get a subset of tags for a repository, and resolve timestamps only for that subset.
+
+    Args:
+        repo: Repository in format [registry/]namespace/repository
+        select: Function that selects tags from an (unsorted) stream of tags, sorted by version
+        refresh: Re-fetch the tag list from the registry instead of using the index
+        aliases: Group selected tags that point to the same digest, and list all their aliases
+        on_tag: Function to call with each tag as it's received, before timestamps are resolved
+    """
+    import asyncio
+
+    def fetch(refresh: bool, recheck: bool, on_tag: Callable[[Tag], Any] | None) -> list[Tag]:
+        tags = iter_repo_tags(repo, refresh, recheck)
+        if on_tag:
+            tags = (tag for tag in tags if on_tag(tag) or True)
+        return select(tags)
+
+    tags = await asyncio.to_thread(fetch, refresh, refresh, on_tag)
+    # Tags from the index can't be resolved directly, so re-fetch if any haven't been resolved yet
+    if not refresh and any(t.ts is None and not t.resolved and t.resolver is None for t in tags):
+        tags = await asyncio.to_thread(fetch, True, False, None)
+    tags = await resolve_timestamps_async(tags)
+    get_index().update_timestamps(normalize_repo(repo), tags)
+    if aliases:
+        tags = await asyncio.to_thread(group_aliases, tags, iter_repo_tags(repo))
+    return tags
+
+
+def group_aliases(tags: list[Tag], all_tags: Iterable[Tag] | None = None) -> list[Tag]:
+    """Combine tags with the same digest, keeping the highest version and listing the others (from
+    all known tags for the repo, if provided) as its aliases. Tags should be sorted by version.
+    """
+    digests = {tag.digest for tag in tags if tag.digest}
+    names_by_digest: dict[str, list[Tag]] = {}
+    for tag in all_tags or tags:
+        if tag.digest in digests:
+            names_by_digest.setdefault(tag.digest, []).append(tag)
+
+    grouped: list[Tag] = []
+    seen_digests = set()
+    for tag in reversed(tags):
+        if tag.digest in seen_digests:
+            continue
+        if tag.digest:
+            seen_digests.add(tag.digest)
+            same_digest = sorted(names_by_digest[tag.digest], key=_version_key, reverse=True)
+            tag.aliases = [t.name for t in same_digest if t.name != tag.name]
+        grouped.append(tag)
+    return grouped[::-1]
+
+
+def fetch_tags(
+    repo: str,
+    limit: int | None = None,
+    since: str | None = None,
+    refresh: bool = False,
+    aliases: bool = False,
+    on_tag: Callable[[Tag], Any] | None = None,
+) -> list[str]:
+    """Get non-ignored tags for a repository, sorted by version. See ``fetch_tags_async()`` for
+    details.
+    """
+    return run_async(fetch_tags_async(repo, limit, since, refresh, aliases, on_tag))
+
+
+async def fetch_tags_async(
+    repo: str,
+    limit: int | None = None,
+    since: str | None = None,
+    refresh: bool = False,
+    aliases: bool = False,
+    on_tag: Callable[[Tag], Any] | None = None,
+) -> list[str]:
+    """Get non-ignored tags for a repository, sorted by version. Multiple repos can be fetched
+    concurrently on the same event loop, e.g. with ``asyncio.gather()``.
+
+    Tags are filtered and selected as they're received, before looking up any timestamps, so that
+    (for registries that need extra requests per tag) only timestamps for the tags that will be
+    shown get fetched. With ``limit``, at most that many tags are kept in memory.
+
+    Args:
+        repo: Repository in format [registry/]namespace/repository
+        limit: Only include this many of the newest versions
+        since: Only include versions greater than or equal to this version
+        refresh: Re-fetch the tag list from the registry instead of using the index
+        aliases: Show tags that point to the same image as aliases of the highest version
+        on_tag: Function to call with each tag as it's received (e.g., to stream output)
+    """
+
+    def select(tags: Iterable[Tag]) -> list[Tag]:
+        if since:
+            min_version = _version_key(Tag(name=since))
+            tags = (tag for tag in tags if _version_key(tag) >= min_version)
+        return latest_tags(tags, limit) if limit else sorted(tags, key=_version_key)
+
+    tags = await fetch_selected_tags_async(repo, select, refresh, aliases, on_tag)
+    return [str(tag) for tag in tags]
+
+
+@dataclass
+class ImageStatus:
+    """Current and newest tags for a service's image"""
+
+    service: str
+    repo: str
+    current: Tag
+    newest: Tag | None = None
+    error: str | None = None
+    pinned_digest: str | None = None  # Digest from the image reference, e.g. "app:1.0@sha256:..."
+
+    @property
+    def is_outdated(self) -> bool:
+        """Check if the newest tag is a different image than the current one. If digests are
+        available, this also catches tags that have been moved to a new image (like "latest").
+        """
+        if not self.newest:
+            return False
+        current_digest = self.pinned_digest or self.current.digest
+        if current_digest and self.newest.digest:
+            return current_digest != self.newest.digest and _version_key(
+                self.newest
+            ) >= _version_key(self.current)
+        return _version_key(self.newest) > _version_key(self.current)
+
+
+def _tag_variant(name: str) -> str | None:
+    """Get the variant suffix of a version tag without any version numbers, e.g. "-alpine" for
+    "1.25.3-alpine3.19", or None for a non-version tag like "latest"
+    """
+    match = VERSION_PATTERN.match(name)
+    return VARIANT_VERSION_PATTERN.sub('', name[match.end() :]) if match else None
+
+
+def newest_matching(tags: list[Tag], name: str) -> Tag | None:
+    """Get the newest tag (from a list sorted by version) with the same variant as the given tag
+    name, or the newest tag overall if it's not a version tag. Pre-releases are only included if
+    the given tag is also a pre-release.
+    """
+    variant = _tag_variant(name)
+    allow_prerelease = Tag(name).is_prerelease
+    return next(
+        (
+            t
+            for t in reversed(tags)
+            if (variant is None or _tag_variant(t.name) == variant)
+            and (allow_prerelease or not t.is_prerelease)
+        ),
+        None,
+    )
+
+
+def select_current_and_newest(tags: Iterable[Tag], names: set[str]) -> list[Tag]:
+    """Select tags with the given names and the newest tag with the same variant as each, sorted by
+    version, along with the newest release overall. Newer pre-releases are only selected for
+    variants with a current tag that's also a pre-release.
+    """
+    # Variants to select the newest tag for, and whether pre-releases are included
+    wanted = {(_tag_variant(name), Tag(name).is_prerelease) for name in names}
+    current: list[Tag] = []
+    newest: Tag | None = None
+    newest_variants: dict[tuple[str, bool], Tag] = {}
+    for tag in tags:
+        if tag.name in names:
+            current.append(tag)
+        if not tag.is_prerelease and (newest is None or _version_key(tag) >= _version_key(newest)):
+            newest = tag
+        if (variant := _tag_variant(tag.name)) is None:
+            continue
+        for key in [(variant, True), (variant, False)]:
+            if key in wanted and (key[1] or not tag.is_prerelease):
+                prev = newest_variants.get(key)
+                if prev is None or _version_key(tag) >= _version_key(prev):
+                    newest_variants[key] = tag
+    selected = {t.name: t for t in [*current, *newest_variants.values()] if t is not newest}
+    # The newest release goes after any other tags with the same version, e.g. "1.27.1-perl"
+    return sorted([*selected.values(), *([newest] if newest else [])], key=_version_key)
+
+
+def check_images(images: list['ServiceImage'], refresh: bool = False) -> list[ImageStatus]:
+    """Get current vs. newest tags for a list of images. Each unique repository is only fetched
+    once, and all repositories are fetched concurrently with a shared session.
+    """
+    return run_async(check_images_async(images, refresh))
+
+
+async def check_images_async(
+    images: list['ServiceImage'], refresh: bool = False
+) -> list[ImageStatus]:
+    """Async version of ``check_images()``"""
+    import asyncio
+
+    import requests
+
+    current_tags: dict[str, set[str]] = {}
+    for image in images:
+        current_tags.setdefault(image.name, set()).add(image.tag)
+    repos = sorted(current_tags)
+    logger.info(f'Checking {len(images)} images ({len(repos)} unique repositories)')
+    try:
+        await asyncio.to_thread(prefetch_tokens, repos)
+    except requests.RequestException as e:
+        logger.warning(f'Failed to fetch shared token; falling back to per-repo tokens: {e}')
+
+    # Only look up timestamps for the current and newest matching tags
+    async def fetch(repo: str) -> list[Tag] | Exception:
+        try:
+            select = partial(select_current_and_newest, names=current_tags[repo])
+            return await fetch_selected_tags_async(repo, select, refresh)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f'Failed to fetch tags for {repo}: {e}')
+            return e
+
+    results = await asyncio.gather(*(fetch(repo) for repo in repos))
+    repo_tags = dict(zip(repos, results, strict=True))
+    statuses = []
+    for image in images:
+        tags = repo_tags[image.name]
+        status = ImageStatus(
+            service=image.service,
+            repo=image.name,
+            current=Tag(image.tag),
+            pinned_digest=image.digest,
+        )
+        if isinstance(tags, Exception):
+            status.error = str(tags)
+        elif tags:
+            status.current = next((t for t in tags if t.name == image.tag), status.current)
+            status.newest = newest_matching(tags, image.tag)
+        statuses.append(status)
+    return statuses
+
+
+def load_images(repos: list[str], compose_files: list[Path]) -> list['ServiceImage']:
+    """Get images from repository names and/or docker-compose files. If a directory is given, all
+    compose files under it are included.
+    """
+    from docker_compose import ComposeCache, ServiceImage, get_images, scan_images
+
+    images = [ServiceImage(service=repo, image=repo) for repo in repos]
+    for compose_file in compose_files:
+        if compose_file.is_dir():
+            images.extend(i for f in scan_images(compose_file, ComposeCache()) for i in f.images)
+        else:
+            images.extend(get_images(compose_file))
+    return images
+
+
+def print_report(statuses: list[ImageStatus]):
+    """Print a table of current vs. newest tags, marking images with updates available"""
+    rows = [('SERVICE', 'IMAGE', 'CURRENT', 'NEWEST')]
+    for s in statuses:
+        current = f'{s.current} @{s.pinned_digest[:19]}' if s.pinned_digest else str(s.current)
+        newest = s.error or str(s.newest or '')
+        rows.append((s.service, s.repo, current, f'{newest} *' if s.is_outdated else newest))
+    widths = [max(len(row[i]) for row in rows) for i in range(3)]
+    for row in rows:
+        print('  '.join([*(col.ljust(w) for col, w in zip(row, widths, strict=False)), row[3]]))
 
 
 def main():
     parser = argparse.ArgumentParser(description='Fetch all tags and dates for a Docker container')
-    parser.add_argument('repo', help='Repository in format [registry/]namespace/repository')
+    parser.add_argument(
+        'repo',
+        nargs='*',
+        help='Repository in format [registry/]namespace/repository. If multiple repositories are '
+        'given, show a report of current vs. newest tags.',
+    )
+    parser.add_argument(
+        '-c',
+        '--compose',
+        type=Path,
+        action='append',
+        default=[],
+        help='Show a report of current vs. newest tags for images in a docker-compose file, or '
+        'all compose files in a directory (may be specified multiple times)',
+    )
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose logging')
+    parser.add_argument(
+        '-l', '--limit', '--latest', type=int, help='Only show the N newest versions'
+    )
+    parser.add_argument('-s', '--since', help='Only show versions >= this version')
+    parser.add_argument(
+        '-a',
+        '--aliases',
+        action='store_true',
+        help='Group tags that point to the same image (e.g., "1.25.3 (1.25, latest)")',
+    )
+    parser.add_argument(
+        '-o',
+        '--stream',
+        action='store_true',
+        help='Show tags as they are received, followed by a sorted summary',
+    )
+    parser.add_argument(
+        '-f',
+        '--refresh',
+        action='store_true',
+        help='Re-fetch tag lists from the registry instead of using the local tag index, and '
+        'check if any tags have moved',
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=WORKERS,
+        help=f'Max concurrent requests for tag timestamps (default: {WORKERS})',
+    )
+    parser.add_argument(
+        '-r',
+        '--rate-limit',
+        type=float,
+        help='Max requests per second to each registry host (default: unlimited)',
+    )
+    parser.add_argument(
+        '-m',
+        '--max-staleness',
+        type=int,
+        metavar='SECONDS',
+        help='Use expired tag lists up to this many seconds past expiration, while revalidating '
+        'them in the background (default: always revalidate before use)',
+    )
+    parser.add_argument(
+        '-p',
+        '--platform',
+        help='Platform to show dates for multi-arch images, e.g. "linux/arm64" '
+        '(default: first platform listed)',
+    )
     args = parser.parse_args()
+    if not args.repo and not args.compose:
+        parser.error('At least one repository or compose file is required')
     if args.verbose:
         basicConfig(level='INFO')
-    for tag in fetch_tags(args.repo):
-        print(tag)
+    configure(
+        workers=args.workers,
+        rate_limit=args.rate_limit,
+        platform=args.platform,
+        max_staleness=timedelta(seconds=args.max_staleness) if args.max_staleness else None,
+    )
+
+    if args.compose or len(args.repo) > 1:
+        print_report(check_images(load_images(args.repo, args.compose), refresh=args.refresh))
+    else:
+        tags = fetch_tags(
+            args.repo[0],
+            limit=args.limit,
+            since=args.since,
+            refresh=args.refresh,
+            aliases=args.aliases,
+            on_tag=partial(print, flush=True) if args.stream else None,
+        )
+        if args.stream:
+            print()
+        for tag in tags:
+            print(tag)
 
 
 if __name__ == '__main__':
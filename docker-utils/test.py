@@ -1,6 +1,73 @@
+import asyncio
+import json
+import shutil
+import socket
+import subprocess
+import sys
+from contextlib import ExitStack
+from datetime import timedelta
+from http.client import HTTPConnection
+from importlib.util import find_spec
+from pathlib import Path
+from time import perf_counter, sleep
+
+import docker_compose
+import get_container_tags as gct
 import pytest
+import requests
+from container_tags_server import TagServer
+from docker_compose import ImageRef, ServiceImage, get_images, interpolate, parse_image
+from fake_registry import FakeRegistry, tag_created
 from get_container_tags import fetch_tags
 
+REPO_DIR = Path(__file__).resolve().parent.parent
+# Settings to point at a fake registry, for each type of registry API it serves
+REGISTRY_URLS = {
+    'codeberg': {'CODEBERG_URL': '{url}', 'CODEBERG_TOKEN_URL': '{url}/token'},
+    'dockerhub': {'DOCKERHUB_API_URL': '{url}/v2'},
+    'ecr': {'ECR_API_URL': '{url}'},
+    'gitlab': {'GITLAB_API_URL': '{url}/api/v4'},
+    'quay': {'QUAY_API_URL': '{url}/api/v1'},
+}
+# Required settings for scripts that read config on import
+STARTUP_ENV = {
+    'VJA_HOST': 'vikunja.localhost',
+    'VJA_TOKEN': 'token',
+    'IGNORE_PROJECTS': '',
+    'IGNORE_LABELS': '',
+    'NC_USER': 'user',
+    'NC_DIR': 'tasks',
+    'NC_HOST': 'nextcloud.localhost',
+}
+
+
+@pytest.fixture
+def local_session(monkeypatch, tmp_path):
+    """Use a non-persistent cache and a temporary tag index, so tests against the fake registry
+    start cold
+    """
+    monkeypatch.setattr(gct, 'session', gct.create_session(backend='memory'))
+    monkeypatch.setattr(gct, 'TOKENS', gct.TokenCache())
+    monkeypatch.setattr(gct, 'INDEX', gct.TagIndex(tmp_path / 'container_tags.db'))
+    yield gct.session
+    gct.configure()
+
+
+@pytest.fixture
+def fake_registry(local_session, monkeypatch):
+    """Start fake registries, and point the URLs for a registry type at them. Each registry is
+    stopped after the test.
+    """
+    with ExitStack() as stack:
+
+        def start(registry_type: str, **kwargs) -> FakeRegistry:
+            registry = stack.enter_context(FakeRegistry(**kwargs))
+            for name, url in REGISTRY_URLS[registry_type].items():
+                monkeypatch.setattr(gct, name, url.format(url=registry.url))
+            return registry
+
+        yield start
+
 
 @pytest.mark.parametrize(
     'repo, expected_tag',
@@ -17,3 +84,748 @@ from get_container_tags import fetch_tags
 )
 def test_fetch_tags(repo, expected_tag):
     assert expected_tag in fetch_tags(repo)
+
+
+@pytest.mark.parametrize('workers', [1, 8])
+def test_fetch_oci_tags__concurrent(local_session, workers):
+    gct.configure(workers=workers)
+    with FakeRegistry(n_tags=250, page_size=100) as registry:
+        tags = gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake')
+        tags = list(gct.resolve_timestamps(tags))
+
+    # Tags should be in original order, with timestamps resolved via both manifests and indexes
+    assert [t.name for t in tags] == registry.tags
+    assert [t.ts for t in tags] == [tag_created(i) for i in range(250)]
+
+
+def test_fetch_oci_tags__rate_limit(local_session):
+    gct.configure(workers=8, rate_limit=100)
+    with FakeRegistry(n_tags=30) as registry:
+        start = perf_counter()
+        tags = gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake')
+        list(gct.resolve_timestamps(tags))
+        elapsed = perf_counter() - start
+    assert elapsed >= (registry.request_count - 1) / 100
+
+
+def test_token_cache__shared_token(local_session):
+    with FakeRegistry(n_tags=10) as registry:
+        scopes = ['repository:org/image_1:pull', 'repository:org/image_2:pull']
+        gct.TOKENS.fetch(registry.token_url, 'fake', scopes)
+        for path in ['org/image_1', 'org/image_2', 'org/image_1']:
+            tags = gct._fetch_oci_tags(registry.url, path, registry.token_url, 'fake')
+            assert len(list(gct.resolve_timestamps(tags))) == 10
+
+    # A single token should be used for both repositories
+    assert registry.token_requests == [{'service': ['fake'], 'scope': scopes}]
+
+
+def test_token_cache__refresh_on_401(local_session):
+    with FakeRegistry(n_tags=10) as registry:
+        tags = list(gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake'))
+        registry.revoke_tokens()
+        tags = list(gct.resolve_timestamps(tags))
+
+    assert all(t.ts for t in tags)
+    assert len(registry.token_requests) == 2
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_fetch_gitlab_tags__concurrent(fake_registry, ordered):
+    gct.configure(workers=8)
+    registry = fake_registry('gitlab', n_tags=250, throttle_every=20)
+    tags = gct.fetch_gitlab_tags('registry.gitlab.com/group/project')
+    tags = list(gct.resolve_timestamps(tags, ordered=ordered))
+
+    # Throttled (429) requests should be retried until all timestamps are resolved
+    assert registry.throttled_count > 0
+    if ordered:
+        assert [t.name for t in tags] == registry.tags
+    assert sorted((t.name, t.ts) for t in tags) == sorted(
+        (tag, tag_created(i)) for i, tag in enumerate(registry.tags)
+    )
+
+
+def test_fetch_tags__limit(fake_registry):
+    registry = fake_registry('gitlab', n_tags=250)
+    tags = fetch_tags('registry.gitlab.com/group/project', limit=5)
+
+    # Only timestamps for the 5 newest tags should be fetched (+ 1 repo lookup and 3 pages)
+    assert tags == [f'{tag} - {tag_created(i)[:10]}' for i, tag in enumerate(registry.tags)][-5:]
+    assert registry.request_count == 1 + 3 + 5
+
+
+def test_fetch_tags__since(fake_registry):
+    registry = fake_registry('gitlab', n_tags=250)
+    tags = fetch_tags('registry.gitlab.com/group/project', since='2.4.0')
+
+    assert [t.split(' ')[0] for t in tags] == registry.tags[240:]
+    assert registry.request_count == 1 + 3 + 10
+
+
+def test_fetch_tags__index(fake_registry):
+    registry = fake_registry('gitlab', n_tags=250)
+    tags = fetch_tags('registry.gitlab.com/group/project', limit=5)
+    assert registry.request_count == 1 + 3 + 5
+
+    # Repeat queries should be answered from the index, without any requests
+    gct.session.cache.clear()
+    assert fetch_tags('registry.gitlab.com/group/project', limit=5) == tags
+    assert registry.request_count == 1 + 3 + 5
+
+    # After the tag list expires, only the tag list should be re-fetched, and timestamps for
+    # tags already in the index should be reused
+    gct.INDEX.conn.execute('UPDATE repos SET updated = 0')
+    assert fetch_tags('registry.gitlab.com/group/project', limit=5) == tags
+    assert registry.request_count == (1 + 3 + 5) + (1 + 3)
+
+    # Tags that haven't been resolved yet should still get fetched (with the tag list from the
+    # HTTP cache)
+    assert len(fetch_tags('registry.gitlab.com/group/project', limit=6)) == 6
+    assert registry.request_count == (1 + 3 + 5) + (1 + 3) + 1
+
+
+def test_fetch_tags__index_no_timestamp(fake_registry, monkeypatch):
+    """Tags that were resolved without a timestamp shouldn't be looked up again while the index is
+    fresh
+    """
+    fetch_gitlab_timestamp = gct._fetch_gitlab_timestamp
+
+    def fetch_timestamp(base, repo_id, tag):
+        timestamp = fetch_gitlab_timestamp(base, repo_id, tag)
+        return (None, None) if tag == '2.4.9' else timestamp
+
+    monkeypatch.setattr(gct, '_fetch_gitlab_timestamp', fetch_timestamp)
+    registry = fake_registry('gitlab', n_tags=250)
+    tags = fetch_tags('registry.gitlab.com/group/project', limit=5)
+    assert tags[-1] == '2.4.9'
+    assert registry.request_count == 1 + 3 + 5
+
+    gct.session.cache.clear()
+    assert fetch_tags('registry.gitlab.com/group/project', limit=5) == tags
+    assert registry.request_count == 1 + 3 + 5
+
+
+def test_fetch_tags__aliases(local_session):
+    with FakeRegistry(n_tags=30, aliases=True) as registry:
+        tags = gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake')
+        tags = sorted(gct.resolve_timestamps(tags), key=gct._version_key)
+        tags = gct.group_aliases(tags)
+
+    # Each tag should only need a HEAD request, and manifests and config blobs should only be
+    # fetched once per unique digest
+    n_indexes = len(registry.versions[::3])
+    n_versions = len(registry.versions)
+    assert registry.request_count == 2 + len(registry.tags) + n_versions + n_indexes + n_versions
+    assert [str(t) for t in tags if t.aliases] == [
+        f'0.0.9 (0.0) - {tag_created(9)[:10]}',
+        f'0.1.9 (0.1) - {tag_created(19)[:10]}',
+        f'0.2.9 (0.2, latest) - {tag_created(29)[:10]}',
+    ]
+
+
+@pytest.mark.parametrize(
+    'registry_type, repo, n_list_requests',
+    [('codeberg', 'codeberg.org/org/image', 1), ('gitlab', 'registry.gitlab.com/group/project', 2)],
+)
+def test_fetch_tags__moved_tag(fake_registry, registry_type, repo, n_list_requests):
+    """For registries that don't list digests, tags should only be resolved again (in case they've
+    been moved to a different image) on a forced refresh, not every time the tag list expires
+    """
+    registry = fake_registry(registry_type, n_tags=30, aliases=True)
+    tags = fetch_tags(repo, aliases=True)
+    assert tags[-1] == f'0.2.9 (0.2, latest) - {tag_created(29)[:10]}'
+
+    # After the tag list expires, only the tag list should be requested again
+    registry.move_tag('latest', '0.0.5')
+    _expire_tag_lists()
+    request_count = registry.request_count
+    assert fetch_tags(repo, aliases=True) == tags
+    assert registry.request_count == request_count + n_list_requests
+
+    # With a refresh, the moved tag should be detected
+    tags = fetch_tags(repo, aliases=True, refresh=True)
+    assert f'0.0.5 (latest) - {tag_created(5)[:10]}' in tags
+    assert tags[-1] == f'0.2.9 (0.2) - {tag_created(29)[:10]}'
+
+
+def test_fetch_tags_async(fake_registry):
+    repos = [f'registry.gitlab.com/group/project_{i}' for i in range(5)]
+
+    async def fetch_all():
+        return await asyncio.gather(*(gct.fetch_tags_async(repo, limit=5) for repo in repos))
+
+    registry = fake_registry('gitlab', n_tags=250)
+    results = gct.run_async(fetch_all())
+
+    expected = [f'{tag} - {tag_created(i)[:10]}' for i, tag in enumerate(registry.tags)][-5:]
+    assert results == [expected] * 5
+    assert registry.request_count == (1 + 3 + 5) * 5
+
+
+def test_fetch_tags__running_loop(fake_registry):
+    """The sync API should also work when called from a running event loop (e.g., in Jupyter)"""
+
+    async def fetch():
+        return fetch_tags('registry.gitlab.com/group/project', limit=5)
+
+    registry = fake_registry('gitlab', n_tags=250)
+    tags = asyncio.run(fetch())
+
+    assert tags == [f'{tag} - {tag_created(i)[:10]}' for i, tag in enumerate(registry.tags)][-5:]
+
+
+def test_fetch_tags_async__max_concurrent(fake_registry):
+    """Concurrent Docker Hub pages for concurrent repos should share the limit on concurrent
+    requests
+    """
+    gct.configure(workers=4)
+    repos = [f'org/image_{i}' for i in range(4)]
+
+    async def fetch_all():
+        return await asyncio.gather(*(gct.fetch_tags_async(repo, limit=5) for repo in repos))
+
+    registry = fake_registry('dockerhub', n_tags=900, latency=0.02)
+    results = gct.run_async(fetch_all())
+
+    assert all(len(tags) == 5 for tags in results)
+    assert registry.request_count == 9 * 4
+    assert registry.max_in_flight == 4
+
+
+def test_check_images(fake_registry, tmp_path):
+    compose_file = tmp_path / 'docker-compose.yml'
+    compose_file.write_text(
+        'services:\n'
+        '  app:\n'
+        '    image: registry.gitlab.com/group/project:1.0.0\n'
+        '  worker:\n'
+        '    image: registry.gitlab.com/group/project:2.4.9\n'
+    )
+    registry = fake_registry('gitlab', n_tags=250)
+    images = gct.load_images([], [compose_file])
+    statuses = gct.check_images(images)
+
+    assert [(s.service, s.current.name, s.newest.name) for s in statuses] == [
+        ('app', '1.0.0', '2.4.9'),
+        ('worker', '2.4.9', '2.4.9'),
+    ]
+    assert [s.is_outdated for s in statuses] == [True, False]
+    assert all(s.current.ts and s.newest.ts for s in statuses)
+    # The repository should only be listed once, and only current + newest tags resolved
+    assert registry.request_count == 1 + 3 + 2
+
+
+def test_check_images__digests(fake_registry, monkeypatch, tmp_path):
+    """Images should be compared by digest, across included files and extended services"""
+    registry = fake_registry('gitlab', n_tags=250, aliases=True)
+    monkeypatch.setenv('APP_TAG', '2.4.9')
+    repo = 'registry.gitlab.com/group/project'
+    (tmp_path / 'docker-compose.yml').write_text(
+        'include: [other/compose.yml]\n'
+        'services:\n'
+        f'  app:\n    image: {repo}:${{APP_TAG}}\n'
+        f'  latest:\n    image: {repo}:${{LATEST_TAG:-latest}}\n'
+        f'  pinned:\n    image: {repo}:2.4.9@{registry.digests["1.0.0"]}\n'
+    )
+    (tmp_path / 'other').mkdir()
+    (tmp_path / 'other' / '.env').write_text('WORKER_TAG=1.0\n')
+    (tmp_path / 'other' / 'compose.yml').write_text(
+        f'services:\n  base:\n    image: {repo}:${{WORKER_TAG}}\n  worker:\n    extends: base\n'
+    )
+    images = gct.load_images([], [tmp_path / 'docker-compose.yml'])
+    statuses = gct.check_images(images)
+
+    assert [(s.service, s.current.name, s.newest.name, s.is_outdated) for s in statuses] == [
+        ('base', '1.0', '2.4.9', True),
+        ('worker', '1.0', '2.4.9', True),
+        ('app', '2.4.9', '2.4.9', False),
+        ('latest', 'latest', '2.4.9', False),  # Same digest as the newest version
+        ('pinned', '2.4.9', '2.4.9', True),  # Pinned to an older digest
+    ]
+
+
+def test_scan_images(tmp_path, monkeypatch):
+    """All compose files in a directory tree should be parsed (in parallel), and cached until they
+    or any of the files they use change
+    """
+    root = tmp_path / 'stacks'
+    for i in range(20):
+        (root / f'stack_{i}').mkdir(parents=True)
+        (root / f'stack_{i}' / 'compose.yaml').write_text(
+            f'services:\n  web:\n    image: nginx:1.25\n  app:\n    image: org/app_{i % 2}:1.0\n'
+        )
+    (root / 'shared').mkdir()
+    (root / 'shared' / 'docker-compose.yml').write_text('services:\n  db:\n    image: $DB\n')
+    (root / 'shared' / '.env').write_text('DB=postgres:16\n')
+    (root / 'stack_0' / 'compose.yaml').write_text(
+        'include: [../shared/docker-compose.yml]\nservices:\n  web:\n    image: nginx:1.25\n'
+    )
+    (root / '.hidden').mkdir()
+    (root / '.hidden' / 'compose.yaml').write_text('services: [\n')
+    cache = docker_compose.ComposeCache(tmp_path / 'compose_images.db')
+
+    def get_counts():
+        compose_files = docker_compose.scan_images(root, cache)
+        return {u.image: u.count for u in docker_compose.get_inventory(compose_files, root)}
+
+    expected = {'nginx:1.25': 20, 'org/app_0:1.0': 9, 'org/app_1:1.0': 10, 'postgres:16': 1}
+    assert get_counts() == expected
+
+    # Unchanged files should be read from the cache without parsing
+    monkeypatch.setattr(docker_compose, '_load_yaml', None)
+    assert get_counts() == expected
+    monkeypatch.undo()
+
+    # Changes to any files used by a compose file (like an included file's .env) should be detected
+    (root / 'shared' / '.env').write_text('DB=postgres:17-alpine\n')
+    del expected['postgres:16']
+    assert get_counts() == {**expected, 'postgres:17-alpine': 1}
+
+
+def test_scan_images__overrides(tmp_path):
+    """Override files should be merged into their base file, and partial files next to a base file
+    shouldn't be counted as separate stacks
+    """
+    (tmp_path / 'app').mkdir()
+    (tmp_path / 'app' / 'compose.yaml').write_text(
+        'services:\n  web:\n    image: nginx:1.25\n  db:\n    image: postgres:16\n'
+    )
+    (tmp_path / 'app' / 'docker-compose.prod.yml').write_text(
+        'services:\n  web:\n    image: nginx:1.27\n'
+    )
+    (tmp_path / 'dev').mkdir()
+    (tmp_path / 'dev' / 'docker-compose.dev.yml').write_text(
+        'services:\n  app:\n    image: org/app:1.0\n'
+    )
+    cache = docker_compose.ComposeCache(tmp_path / 'compose_images.db')
+
+    def get_services():
+        compose_files = docker_compose.scan_images(tmp_path, cache)
+        return {s: u.image for u in docker_compose.get_inventory(compose_files) for s in u.services}
+
+    app, dev = tmp_path / 'app' / 'compose.yaml', tmp_path / 'dev' / 'docker-compose.dev.yml'
+    expected = {f'{app}:web': 'nginx:1.25', f'{app}:db': 'postgres:16', f'{dev}:app': 'org/app:1.0'}
+    assert get_services() == expected
+
+    # Adding an override file should update cached results for its base file
+    (tmp_path / 'app' / 'compose.override.yaml').write_text(
+        'services:\n  db:\n    image: postgres:17\n'
+    )
+    assert get_services() == {**expected, f'{app}:db': 'postgres:17'}
+
+
+@pytest.mark.parametrize(
+    'image, expected',
+    [
+        ('nginx', ImageRef('nginx')),
+        ('nginx:1.25', ImageRef('nginx', '1.25')),
+        ('localhost:5000/org/app', ImageRef('localhost:5000/org/app')),
+        ('localhost:5000/org/app:1.0', ImageRef('localhost:5000/org/app', '1.0')),
+        ('org/app@sha256:abc', ImageRef('org/app', None, 'sha256:abc')),
+        ('ghcr.io/org/app:1.0@sha256:abc', ImageRef('ghcr.io/org/app', '1.0', 'sha256:abc')),
+    ],
+)
+def test_parse_image(image, expected):
+    assert parse_image(image) == expected
+
+
+@pytest.mark.parametrize(
+    'value, expected',
+    [
+        ('app:$TAG', 'app:1.0'),
+        ('app:${TAG}', 'app:1.0'),
+        ('app:${UNSET:-latest}', 'app:latest'),
+        ('app:${EMPTY:-latest}', 'app:latest'),
+        ('app:${EMPTY-latest}', 'app:'),
+        ('app:${TAG:+set}', 'app:set'),
+        ('app:${UNSET+set}', 'app:'),
+        ('app:$$TAG', 'app:$TAG'),
+        ('app:${UNSET:-${TAG}}', 'app:1.0'),
+        ('app:${UNSET:-${EMPTY:-latest}}-alpine', 'app:latest-alpine'),
+        ('app:${TAG:+${TAG}-alpine}', 'app:1.0-alpine'),
+        ('app:${UNSET:-$$}}', 'app:$}'),
+        ('app:${TAG', 'app:${TAG'),
+    ],
+)
+def test_interpolate(value, expected):
+    assert interpolate(value, {'TAG': '1.0', 'EMPTY': ''}) == expected
+
+
+def test_interpolate__required():
+    with pytest.raises(ValueError, match='TAG is required'):
+        interpolate('app:${TAG:?TAG is required}', {'TAG': ''})
+
+
+def test_get_images__extends_file(tmp_path):
+    (tmp_path / 'base.yml').write_text('services:\n  web:\n    image: nginx:1.25-alpine\n')
+    (tmp_path / 'docker-compose.yml').write_text(
+        'services:\n'
+        '  web:\n    extends:\n      file: base.yml\n      service: web\n'
+        '  db:\n    build: .\n'
+    )
+    images = get_images(tmp_path / 'docker-compose.yml', env={})
+    assert [(i.service, i.name, i.tag) for i in images] == [('web', 'nginx', '1.25-alpine')]
+
+
+def test_select_current_and_newest__variants():
+    """The newest tag with the same variant suffix as each current tag should be selected"""
+    names = ['1.25.0', '1.25.0-alpine3.19', '1.27.1-perl', '1.27.1-alpine3.20', '1.27.1', 'latest']
+    tags = [gct.Tag(name) for name in names]
+    selected = gct.select_current_and_newest(tags, {'1.25.0-alpine3.19', 'latest'})
+    assert [t.name for t in selected] == [
+        'latest',
+        '1.25.0-alpine3.19',
+        '1.27.1-alpine3.20',
+        '1.27.1',
+    ]
+    assert gct.newest_matching(selected, '1.25.0-alpine3.19').name == '1.27.1-alpine3.20'
+    assert gct.newest_matching(selected, 'latest').name == '1.27.1'
+
+
+@pytest.mark.parametrize(
+    'current, expected_newest',
+    [
+        ('1.25.3', '1.26.0'),
+        ('latest', '1.26.0'),
+        ('2.0.0-rc.1', '2.0.0-rc.2'),
+        ('1.26.0-alpine', '1.26.0-alpine'),
+        ('2.0.0-beta1-alpine', '2.0.0-rc1-alpine'),
+    ],
+)
+def test_select_current_and_newest__prereleases(current, expected_newest):
+    """Pre-releases should only be considered newer than a current tag that's also a pre-release"""
+    names = ['1.26.0-alpine', '2.0.0-beta1-alpine', '2.0.0-rc1-alpine']
+    names += ['1.25.3', '1.26.0', '2.0.0-rc.1', '2.0.0-rc.2', 'latest']
+    selected = gct.select_current_and_newest([gct.Tag(name) for name in names], {current})
+    assert gct.newest_matching(selected, current).name == expected_newest
+
+    status = gct.ImageStatus('app', 'org/app', gct.Tag(current), gct.Tag(expected_newest))
+    assert status.is_outdated == (current != expected_newest)
+
+
+def test_version_key():
+    names = ['1.0.0', 'latest', '1.0.0-rc.1', '1.0.post1', '2.0.0a1', '1.0.0-beta.11', '1.0']
+    names += ['1.0.0-beta.2', '1.0.0-alpha', 'v2.0.0', '1.0.0.dev1', '9-alpine', '10']
+    tags = sorted((gct.Tag(name) for name in names), key=gct._version_key)
+    assert [t.name for t in tags] == [
+        'latest',
+        '1.0',
+        '1.0.post1',
+        '1.0.0.dev1',
+        '1.0.0-alpha',
+        '1.0.0-beta.2',
+        '1.0.0-beta.11',
+        '1.0.0-rc.1',
+        '1.0.0',
+        '2.0.0a1',
+        'v2.0.0',
+        '9-alpine',
+        '10',
+    ]
+
+
+@pytest.mark.parametrize(
+    'name, expected',
+    [('1.0.0', False), ('latest', False), ('1.0.0-arm64', True), ('sha256-abc.sig', True)],
+)
+def test_tag_is_ignored(name, expected):
+    assert gct.Tag(name).is_ignored is expected
+
+
+def test_fetch_dockerhub_tags__concurrent(fake_registry):
+    registry = fake_registry('dockerhub', n_tags=450)
+    tags = list(gct.fetch_dockerhub_tags('org/image'))
+
+    # Pages after the first should be fetched based on the total count, without following links
+    assert [t.name for t in tags] == registry.tags[::-1]
+    assert all(t.ts and t.digest for t in tags)
+    assert registry.request_count == 5
+
+
+@pytest.mark.parametrize(
+    'registry_type, repo, n_requests',
+    [('quay', 'quay.io/org/image', 3), ('ecr', 'public.ecr.aws/org/image', 1)],
+)
+def test_fetch_tags__paginated(fake_registry, registry_type, repo, n_requests):
+    registry = fake_registry(registry_type, n_tags=250)
+    tags = fetch_tags(repo, limit=5)
+
+    # Timestamps should be included in tag lists, in both ISO 8601 and RFC 2822 formats
+    assert tags == [f'{tag} - {tag_created(i)[:10]}' for i, tag in enumerate(registry.tags)][-5:]
+    assert registry.request_count == n_requests
+
+
+def test_fetch_tags__stream(fake_registry):
+    received = []
+    registry = fake_registry('dockerhub', n_tags=450)
+    tags = fetch_tags('org/image', limit=3, on_tag=received.append)
+
+    # All tags should be passed to the callback as they're received, and only the top 3 returned
+    assert [t.name for t in received] == registry.tags[::-1]
+    assert tags == [f'{tag} - {tag_created(i)[:10]}' for i, tag in enumerate(registry.tags)][-3:]
+
+
+def test_tag_index__write_tags(tmp_path):
+    index = gct.TagIndex(tmp_path / 'container_tags.db')
+    index.update_tags('org/image', [gct.Tag(f'1.0.{i}', ts=tag_created(i)) for i in range(1200)])
+    assert index.is_fresh('org/image')
+
+    # Tags are written in chunks as they're consumed, and removed tags are deleted at the end
+    new_tags = index.write_tags('org/image', (gct.Tag(f'1.0.{i}') for i in range(600, 1300)))
+    assert next(new_tags).ts == tag_created(600)
+    assert len(list(new_tags)) == 699
+    tags = index.get_tags('org/image')
+    assert sorted(t.name for t in tags) == sorted(f'1.0.{i}' for i in range(600, 1300))
+    assert sum(1 for t in tags if t.ts) == 600
+
+
+@pytest.mark.parametrize('platform', [None, 'linux/amd64', 'linux/arm64', 'linux/arm64/v8'])
+def test_fetch_oci_tags__platform(local_session, platform):
+    gct.configure(platform=platform)
+    with FakeRegistry(n_tags=30) as registry:
+        tags = gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake')
+        tags = list(gct.resolve_timestamps(tags))
+
+    # OCI indexes and Docker manifest lists should both use the child for the selected platform
+    multi_arch_platform = 'linux/arm64/v8' if platform and 'arm64' in platform else 'linux/amd64'
+    assert [t.ts for t in tags] == [
+        tag_created(i, multi_arch_platform if i % 3 == 0 else 'linux/amd64') for i in range(30)
+    ]
+
+
+def test_fetch_oci_tags__manifest_index(local_session):
+    def fetch():
+        gct.session.cache.clear()
+        gct.TOKENS = gct.TokenCache()
+        tags = gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake')
+        return list(gct.resolve_timestamps(tags))
+
+    with FakeRegistry(n_tags=30) as registry:
+        fetch()
+        assert registry.request_count == 2 + 30 + 30 + 10 + 30
+
+        # Child manifests and timestamps should be read from the index on subsequent runs
+        tags = fetch()
+        assert registry.request_count == (2 + 30 + 30 + 10 + 30) + (2 + 30)
+    assert [t.ts for t in tags] == [tag_created(i) for i in range(30)]
+
+
+def test_fetch_oci_tags__moved_tag(local_session):
+    """Tag digests should be checked with uncached HEAD requests, so a moved tag is picked up
+    right away, without re-fetching manifests that were already fetched by digest
+    """
+
+    def fetch():
+        tags = gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake')
+        return {t.name: t for t in gct.resolve_timestamps(tags)}
+
+    with FakeRegistry(n_tags=30, aliases=True) as registry:
+        fetch()
+        n_requests = registry.request_count
+        registry.move_tag('latest', '0.0.5')
+        tags = fetch()
+        assert registry.request_count == n_requests + len(registry.tags)
+    assert tags['latest'].digest == registry.digests['0.0.5']
+    assert tags['latest'].ts == tag_created(5)
+
+
+def test_tag_index__platform(tmp_path, monkeypatch):
+    index = gct.TagIndex(tmp_path / 'container_tags.db')
+    index.update_tags('org/image', [gct.Tag('1.0.0', ts=tag_created(0))])
+    assert index.get_tags('org/image')[0].ts == tag_created(0)
+
+    # Timestamps resolved for a different platform shouldn't be reused
+    monkeypatch.setattr(gct, 'PLATFORM', 'linux/arm64')
+    assert index.get_tags('org/image')[0].ts is None
+
+
+def _expire_tag_lists():
+    """Expire the tag list index and all cached responses"""
+    gct.INDEX.conn.execute('UPDATE repos SET updated = 0')
+    gct.session.cache.reset_expiration(timedelta(seconds=-1))
+
+
+def test_fetch_tags__revalidate(fake_registry):
+    registry = fake_registry('dockerhub', n_tags=450)
+    tags = fetch_tags('org/image', limit=5)
+    bytes_sent = registry.bytes_sent
+
+    # Expired tag lists should be revalidated with conditional requests
+    _expire_tag_lists()
+    assert fetch_tags('org/image', limit=5) == tags
+    assert registry.request_count == 5 + 5
+    assert registry.not_modified_count == 5
+    assert registry.bytes_sent == bytes_sent
+
+
+def test_fetch_tags__max_staleness(fake_registry):
+    gct.configure(max_staleness=timedelta(hours=1))
+    registry = fake_registry('dockerhub', n_tags=450)
+    tags = fetch_tags('org/image', limit=5)
+
+    # Expired tag lists should be returned without waiting for the registry to respond, and
+    # revalidated in the background
+    _expire_tag_lists()
+    with registry.hold_responses():
+        assert fetch_tags('org/image', limit=5) == tags
+        assert registry.not_modified_count == 0
+    for _ in range(100):
+        if registry.not_modified_count == 5:
+            break
+        sleep(0.01)
+    assert registry.not_modified_count == 5
+
+
+def test_max_per_host(local_session):
+    gct.configure(workers=8, max_per_host=2)
+    with FakeRegistry(n_tags=30, latency=0.01) as registry:
+        tags = gct._fetch_oci_tags(registry.url, 'org/image', registry.token_url, 'fake')
+        assert all(t.ts for t in gct.resolve_timestamps(tags))
+    assert registry.max_in_flight == 2
+
+
+@pytest.mark.parametrize('use_socket', [False, True])
+def test_tag_server(fake_registry, tmp_path, use_socket):
+    compose_file = tmp_path / 'docker-compose.yml'
+    compose_file.write_text(
+        'services:\n'
+        '  app:\n'
+        '    image: registry.gitlab.com/group/project:1.0.0\n'
+        '  worker:\n'
+        '    image: registry.gitlab.com/group/project:2.4.9\n'
+    )
+    socket_path = tmp_path / 'tags.sock' if use_socket else None
+    registry = fake_registry('gitlab', n_tags=250)
+    tag_server = TagServer(gct.load_images([], [compose_file]))
+    server = tag_server.serve(socket_path=socket_path)
+    gct.run_async(tag_server.refresh_all())
+    n_requests = registry.request_count
+
+    def get(path: str):
+        if use_socket:
+            conn = UnixHTTPConnection(str(socket_path))
+        else:
+            conn = HTTPConnection(*server.server_address)
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+
+    # Queries should be answered from memory, without any requests to the registry
+    status, statuses = get('/status')
+    assert status == 200
+    assert [(s['service'], s['current']['name'], s['newest']['name']) for s in statuses] == [
+        ('app', '1.0.0', '2.4.9'),
+        ('worker', '2.4.9', '2.4.9'),
+    ]
+    assert [s['outdated'] for s in statuses] == [True, False]
+    assert statuses[0]['current']['created'] == tag_created(100)
+
+    status, tags = get('/tags/registry.gitlab.com/group/project?limit=3')
+    assert [t['name'] for t in tags] == registry.tags[-3:]
+    assert get('/tags/unknown')[0] == 404
+    assert get('/tags/registry.gitlab.com/group/project?limit=x')[0] == 400
+    assert get('/tags/registry.gitlab.com/group/project?limit=-1')[0] == 400
+    assert registry.request_count == n_requests
+    server.shutdown()
+
+
+def test_tag_server__errors(local_session, monkeypatch):
+    """Errors from a token prefetch or a single repo shouldn't stop the server"""
+    images = [
+        ServiceImage('a', 'ghcr.io/org/a:1.0'),
+        ServiceImage('b', 'ghcr.io/org/b:1.0'),
+    ]
+    tag_server = TagServer(images)
+
+    def prefetch_tokens(repos):
+        raise requests.ConnectionError('unreachable')
+
+    def fetch_sorted_tags(repo, refresh=False):
+        if repo == 'ghcr.io/org/a':
+            raise KeyError('tags')
+        return [gct.Tag('1.0', ts='2024-01-01T00:00:00Z')]
+
+    monkeypatch.setattr(gct, 'prefetch_tokens', prefetch_tokens)
+    monkeypatch.setattr(gct, 'fetch_sorted_tags', fetch_sorted_tags)
+
+    async def resolve_timestamps_async(tags):
+        pass
+
+    monkeypatch.setattr(gct, 'resolve_timestamps_async', resolve_timestamps_async)
+    gct.run_async(tag_server.refresh_all())
+
+    assert tag_server.repos['ghcr.io/org/a'].error == "KeyError: 'tags'"
+    assert tag_server.repos['ghcr.io/org/b'].error is None
+    assert [t.name for t in tag_server.repos['ghcr.io/org/b'].tags] == ['1.0']
+
+
+@pytest.mark.parametrize(
+    'script_dir, args, heavy_modules',
+    [
+        (
+            'docker-utils',
+            ['get_container_tags.py', '--help'],
+            {'requests_cache', 'requests', 'asyncio', 'dateutil', 'yaml'},
+        ),
+        (
+            'docker-utils',
+            ['container_tags_server.py', '--help'],
+            {'requests_cache', 'dateutil', 'yaml'},
+        ),
+        ('parse-yt-links', ['parse-yt-links.py', '--help'], {'requests_cache', 'rich'}),
+        # Scripts without a --help option are only imported
+        ('github-utils', ['-c', 'import export_gh_comments'], {'requests_cache'}),
+        pytest.param(
+            'vikunja-export',
+            ['-c', 'import main'],
+            {'html2text', 'dateutil'},
+            marks=pytest.mark.skipif(
+                find_spec('environ') is None, reason='environ-config is not installed'
+            ),
+        ),
+    ],
+)
+def test_startup(tmp_path, script_dir, args, heavy_modules):
+    """Startup should be fast, and shouldn't import heavy dependencies or open any databases.
+    Scripts are run from a copy of their project, so databases from previous runs aren't counted.
+    """
+    env = {'XDG_CACHE_HOME': str(tmp_path), 'HOME': str(tmp_path), **STARTUP_ENV}
+    cwd = tmp_path / script_dir
+    cwd.mkdir()
+    for path in (REPO_DIR / script_dir).glob('*.py'):
+        shutil.copy(path, cwd)
+    interpreter_imports = _get_import_times(['-c', 'pass'], env, cwd)
+    imports = _get_import_times(args, env, cwd)
+    script_imports = {k: v for k, v in imports.items() if k not in interpreter_imports}
+    assert not {k.strip() for k in imports} & heavy_modules
+    assert not list(tmp_path.rglob('*.db'))
+    # Only count top-level imports from the script, not interpreter startup
+    assert sum(v for k, v in script_imports.items() if not k.startswith(' ')) / 1000 < 250
+
+
+def _get_import_times(args: list[str], env: dict[str, str], cwd: Path) -> dict[str, int]:
+    """Get cumulative import times (in microseconds) for each module imported by a Python command.
+    Nested imports are indented.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=cwd,
+        check=True,
+    )
+    # Lines look like 'import time: <self us> | <cumulative us> | <indented module name>'
+    lines = [line.split('|') for line in result.stderr.splitlines() if '|' in line][1:]
+    return {name[1:].rstrip(): int(cumulative) for _, cumulative, name in lines}
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
@@ -1,64 +1,707 @@
 #!/usr/bin/env python
 # Source: https://gist.github.com/urschrei/5258588
-import email
+import argparse
+import binascii
 import glob
+import mmap
 import os
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime
 from email import policy
+from email.message import EmailMessage
+from email.parser import BytesFeedParser
+from functools import partial
+from hashlib import sha256
+from heapq import heappop, heappush
+from itertools import chain
 from multiprocessing import Pool
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import perf_counter
+from typing import BinaryIO, Iterable, Iterator
 
 EXTENSION = 'eml'
+OUTPUT_DIR = 'output'
+MAILDIR_SUBDIRS = ['cur', 'new', 'tmp']
+# Subdirectory of OUTPUT_DIR for SQLite databases, so they can't be overwritten by attachments
+STATE_DIR = '.extract_eml'
+# For content-addressed output: directory for attachments (stored by SHA-256 digest), and SQLite
+# manifest of which attachments came from which messages
+OBJECTS_DIR = 'objects'
+MANIFEST = os.path.join(STATE_DIR, 'manifest.db')
+# Index of previously processed messages, so unchanged messages can be skipped on reruns
+INDEX = os.path.join(STATE_DIR, 'index.db')
+# Attachments up to this size are hashed in memory before being written, so duplicates are never
+# written to disk. Larger ones are written to a temp file as they're hashed.
+SPOOL_SIZE = 1024 * 1024
+# Messages are sent to workers largest first, out of a window of this many messages found so far.
+# Small messages are sent in batches of up to this many bytes or messages.
+SCHEDULE_WINDOW = 1000
+BATCH_BYTES = 4 * 1024 * 1024
+BATCH_MESSAGES = 50
+# Seconds between progress reports (and saving the index)
+PROGRESS_INTERVAL = 5
+# Max bytes to read at a time. Longer lines are read in pieces, so memory use per worker stays
+# bounded regardless of message or attachment size. Must be longer than any multipart boundary line
+# (at most 74 bytes + line ending, per RFC 2046), so boundaries are always read in one piece.
+CHUNK_SIZE = 64 * 1024
 
+# A piece of a line, and whether it's at the start of a line
+Piece = tuple[bytes, bool]
 
-def extract(filename):
+
+class _LineReader:
+    """Reads a binary file one line at a time, in pieces of at most ``CHUNK_SIZE`` bytes, and keeps
+    track of the last multipart boundary that was reached
     """
-    Try to extract the attachments from all files in cwd
+
+    def __init__(self, f: BinaryIO, end: int | None = None):
+        self.f = f
+        self.remaining = None if end is None else end - f.tell()  # Bytes left before ``end``
+        self.at_line_start = True
+        self.last_boundary: tuple[bytes, bool] | None = None  # (delimiter, is closing delimiter)
+        self._pushback: bytes | None = None
+
+    def readline(self) -> Piece:
+        if self._pushback is not None:
+            line, self._pushback = self._pushback, None
+            return line, True
+        starts_line = self.at_line_start
+        if self.remaining is None:
+            line = self.f.readline(CHUNK_SIZE)
+        else:
+            line = self.f.readline(min(CHUNK_SIZE, self.remaining)) if self.remaining else b''
+            self.remaining -= len(line)
+        self.at_line_start = line.endswith(b'\n')
+        return line, starts_line
+
+    def unread(self, line: bytes):
+        """Put back a complete line, to be returned by the next ``readline()``"""
+        self._pushback = line
+
+
+def _match_boundary(line: bytes, boundaries: list[bytes]) -> tuple[bytes, bool] | None:
+    """Check if a line is a delimiter for any of the enclosing multipart boundaries"""
+    if not line.startswith(b'--'):
+        return None
+    line = line.rstrip()
+    for delimiter in reversed(boundaries):
+        if line == delimiter:
+            return delimiter, False
+        if line == delimiter + b'--':
+            return delimiter, True
+    return None
+
+
+def _read_headers(reader: _LineReader, boundaries: list[bytes]) -> EmailMessage:
+    """Parse headers up to the next blank line"""
+    parser = BytesFeedParser(policy=policy.default)
+    while True:
+        line, starts_line = reader.readline()
+        if not line:
+            break
+        if starts_line and line in (b'\n', b'\r\n'):
+            break
+        if starts_line and _match_boundary(line, boundaries):
+            reader.unread(line)
+            break
+        parser.feed(line)
+    return parser.close()
+
+
+def _read_body(reader: _LineReader, boundaries: list[bytes]) -> Iterator[Piece]:
+    """Read a part's body up to the next boundary (or end of file)"""
+    reader.last_boundary = None
+    while True:
+        line, starts_line = reader.readline()
+        if not line:
+            return
+        if starts_line and (boundary := _match_boundary(line, boundaries)):
+            reader.last_boundary = boundary
+            return
+        yield line, starts_line
+
+
+def _iter_parts(
+    reader: _LineReader, boundaries: list[bytes], headers: EmailMessage | None = None
+) -> Iterator[tuple[EmailMessage, Iterator[Piece]]]:
+    """Iterate over the headers and raw body of each non-multipart part of a message. Each body must
+    be read before moving on to the next part; anything left unread is skipped.
     """
-    # ensure that an output dir exists
-    od = 'output'
-    os.path.exists(od) or os.makedirs(od)
+    headers = headers or _read_headers(reader, boundaries)
+    boundary = headers.get_boundary() if headers.get_content_maintype() == 'multipart' else None
+    if not boundary:
+        body = _read_body(reader, boundaries)
+        yield headers, body
+        for _ in body:
+            pass
+        return
+
+    delimiter = b'--' + boundary.encode()
+    inner_boundaries = [*boundaries, delimiter]
+    for _ in _read_body(reader, inner_boundaries):  # Preamble
+        pass
+    while reader.last_boundary == (delimiter, False):
+        yield from _iter_parts(reader, inner_boundaries)
+    if reader.last_boundary == (delimiter, True):
+        for _ in _read_body(reader, boundaries):  # Epilogue
+            pass
+
+
+def _split_eol(line: bytes) -> tuple[bytes, bytes]:
+    content = line.rstrip(b'\r\n')
+    return content, line[len(content) :]
+
+
+def _decode_base64(body: Iterator[Piece]) -> Iterator[bytes]:
+    buffer = b''
+    for piece, _ in body:
+        buffer += b''.join(piece.split())
+        # Decode complete 4-character groups, and keep the rest for the next piece
+        n_complete = len(buffer) - len(buffer) % 4
+        if n_complete:
+            yield binascii.a2b_base64(buffer[:n_complete])
+            buffer = buffer[n_complete:]
+    if buffer:
+        yield binascii.a2b_base64(buffer + b'=' * (-len(buffer) % 4))
+
+
+# Note: For non-base64 content, line endings are converted to '\n' (the same as reading the message
+# in text mode). The line break before a boundary belongs to the boundary, so each line break is
+# held back until the next line is read.
+def _decode_quoted_printable(body: Iterator[Piece]) -> Iterator[bytes]:
+    eol, carry = b'', b''
+    for piece, _ in body:
+        content, line_eol = _split_eol(carry + piece)
+        carry = b''
+        if line_eol and not line_eol.endswith(b'\n'):
+            # CRLF split between pieces; keep the CR for the next piece
+            carry, line_eol = line_eol, b''
+        if not line_eol and (cut := content.rfind(b'=', len(content) - 2)) >= 0:
+            # Partial line; keep any incomplete escape sequence for the next piece
+            content, carry = content[:cut], content[cut:] + carry
+        soft_break = bool(line_eol) and content.endswith(b'=')
+        yield eol + binascii.a2b_qp(content[:-1] if soft_break else content)
+        eol = b'\n' if line_eol and not soft_break else b''
+    if carry := _split_eol(carry)[0]:
+        yield eol + binascii.a2b_qp(carry)
+
+
+def _decode_raw(body: Iterator[Piece]) -> Iterator[bytes]:
+    eol, carry = b'', b''
+    for piece, _ in body:
+        content, line_eol = _split_eol(carry + piece)
+        carry = b''
+        if line_eol and not line_eol.endswith(b'\n'):
+            # CRLF split between pieces; keep the CR for the next piece
+            carry, line_eol = line_eol, b''
+        yield eol + content
+        eol = b'\n' if line_eol else b''
+
+
+def decode_body(body: Iterator[Piece], encoding: str) -> Iterator[bytes]:
+    """Decode a part's body one piece at a time, based on its Content-Transfer-Encoding"""
+    encoding = encoding.strip().lower()
+    if encoding == 'base64':
+        return _decode_base64(body)
+    elif encoding == 'quoted-printable':
+        return _decode_quoted_printable(body)
+    return _decode_raw(body)
+
+
+class _ContentAddressedFile:
+    """Writes an attachment to a content-addressed store, named by the SHA-256 digest of its
+    content. Identical attachments are only stored once, and since each file is moved into place
+    atomically, concurrent writes of the same attachment can't conflict.
+    """
+
+    def __init__(self, objects_dir: str):
+        self.objects_dir = objects_dir
+        self.digest: str | None = None
+        self.size = 0
+        self._hash = sha256()
+        self._buffer = bytearray()
+        self._tmp = None
+
+    def write(self, data: bytes):
+        self._hash.update(data)
+        self.size += len(data)
+        if self._tmp:
+            self._tmp.write(data)
+            return
+        self._buffer += data
+        if len(self._buffer) > SPOOL_SIZE:
+            self._spill()
+
+    def _spill(self):
+        """Move buffered content to a temp file"""
+        self._tmp = NamedTemporaryFile(dir=self.objects_dir, prefix='.tmp', delete=False)
+        self._tmp.write(self._buffer)
+        self._buffer = bytearray()
+
+    def _discard(self):
+        if self._tmp:
+            self._tmp.close()
+            os.unlink(self._tmp.name)
+            self._tmp = None
+
+    def __enter__(self):
+        os.makedirs(self.objects_dir, exist_ok=True)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._discard()
+            return
+        self.digest = self._hash.hexdigest()
+        path = os.path.join(self.objects_dir, self.digest[:2], self.digest)
+        if os.path.exists(path):
+            self._discard()
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not self._tmp:
+            self._spill()
+        self._tmp.close()
+        os.replace(self._tmp.name, path)
+
+
+@dataclass
+class ExtractResult:
+    """Results from extracting a single message"""
+
+    filename: str
+    start: int = 0
+    message_id: str | None = None
+    attachments: int = 0
+    records: list[tuple] = field(default_factory=list)  # Manifest records, if content-addressed
+    error: str | None = None
+    skipped: bool = False  # Message-ID matched a previously processed message
+
+
+def extract(filename, start=0, end=None, known_id=None, content_addressed=False) -> ExtractResult:
+    """
+    Extract attachments from an email file, or a single message within an mbox file (between the
+    ``start`` and ``end`` offsets). The message is parsed incrementally, and each attachment is
+    decoded and written to disk a piece at a time.
+
+    If ``known_id`` is given and the message has the same Message-ID, it's skipped after reading
+    the headers. With ``content_addressed=True``, attachments are stored by digest instead of
+    filename, and a manifest record is returned for each one.
+    """
+    label = filename if end is None else f'{filename} (offset {start})'
+    result = ExtractResult(filename, start)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     output_count = 0
+    records = result.records
     try:
-        with open(filename, 'r') as f:
-            msg = email.message_from_file(f, policy=policy.default)
-            for attachment in msg.iter_attachments():
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            reader = _LineReader(f, end)
+            message = _read_headers(reader, [])
+            message_id = result.message_id = str(message.get('Message-ID', '')).strip() or None
+            if known_id and message_id == known_id:
+                result.skipped = True
+                return result
+            for headers, body in _iter_parts(reader, [], message):
                 try:
-                    output_filename = attachment.get_filename()
+                    output_filename = headers.get_filename()
                 except AttributeError:
-                    print('Got string instead of filename for %s. Skipping.' % f.name)
+                    print(f'Got string instead of filename for {label}. Skipping.')
+                    continue
+                # Skip any parts that aren't attachments
+                if not output_filename or not os.path.basename(output_filename):
                     continue
-                # If no attachments are found, skip this file
-                if output_filename:
-                    print(f'writing to {output_filename}')
-                    with open(os.path.join(od, output_filename), 'wb') as of:
-                        try:
-                            of.write(attachment.get_payload(decode=True))
-                            output_count += 1
-                        except TypeError:
-                            print("Couldn't get payload for %s" % output_filename)
-            if output_count == 0:
-                print('No attachment found for file %s!' % f.name)
-    # this should catch read and write errors
-    except IOError:
-        print('Problem with %s or one of its attachments!' % f.name)
-    return 1, output_count
-
-
-def extract_all():
-    # let's do this in parallel, using cpu count as number of threads
-    pool = Pool(None)
-    files = list(glob.iglob('*.%s' % EXTENSION))
-    if not files:
-        print('No files found')
+                encoding = str(headers.get('Content-Transfer-Encoding', ''))
+                if content_addressed:
+                    of = _ContentAddressedFile(os.path.join(OUTPUT_DIR, OBJECTS_DIR))
+                else:
+                    basename = os.path.basename(output_filename)
+                    # Don't collide with directories used for state and content-addressed output
+                    if basename in (STATE_DIR, OBJECTS_DIR):
+                        basename = f'_{basename}'
+                    of = open(os.path.join(OUTPUT_DIR, basename), 'wb')
+                with of:
+                    for data in decode_body(body, encoding):
+                        of.write(data)
+                if content_addressed:
+                    records.append(
+                        (label, output_count, message_id, output_filename, of.digest, of.size)
+                    )
+                output_count += 1
+    # this should catch read and write errors, and invalid base64 content
+    except (OSError, binascii.Error) as e:
+        result.error = f'Problem with {label} or one of its attachments: {e}'
+    result.attachments = output_count
+    return result
+
+
+def extract_batch(batch: list[tuple], content_addressed=False) -> tuple[int, float, list]:
+    """Extract a batch of messages, and report which worker process it ran in and how long it
+    took
+    """
+    start = perf_counter()
+    results = [extract(*args, content_addressed=content_addressed) for args in batch]
+    return os.getpid(), perf_counter() - start, results
+
+
+def write_manifest(records: list[tuple]):
+    """Save which attachments (by digest) came from which messages"""
+    os.makedirs(os.path.join(OUTPUT_DIR, STATE_DIR), exist_ok=True)
+    with closing(sqlite3.connect(os.path.join(OUTPUT_DIR, MANIFEST))) as conn, conn:
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS attachments ('
+            '  message TEXT, part INTEGER, message_id TEXT, filename TEXT, digest TEXT,'
+            '  size INTEGER,'
+            '  PRIMARY KEY (message, part)'
+            ')'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_attachments_digest ON attachments (digest)')
+        conn.executemany('INSERT OR REPLACE INTO attachments VALUES (?, ?, ?, ?, ?, ?)', records)
+
+
+class MessageIndex:
+    """Persistent SQLite index of processed messages. A message is considered unchanged if its
+    file has the same modification time and its size is the same (for mbox files, the size of the
+    message itself). If only the modification time has changed (for example, if new messages were
+    appended to an mbox file), the message is only re-extracted if its Message-ID has changed.
+
+    Messages are tracked separately for each output mode (by filename or content-addressed), so
+    extracting in one mode doesn't cause messages to be skipped in the other.
+    """
+
+    def __init__(self, path: str = os.path.join(OUTPUT_DIR, INDEX), content_addressed=False):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.content_addressed = content_addressed
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS messages ('
+                '  path TEXT, start INTEGER, content_addressed INTEGER, size INTEGER,'
+                '  mtime INTEGER, message_id TEXT,'
+                '  PRIMARY KEY (path, start, content_addressed)'
+                ')'
+            )
+        rows = self.conn.execute(
+            'SELECT path, start, size, mtime, message_id FROM messages WHERE content_addressed = ?',
+            (int(content_addressed),),
+        )
+        self.messages = {
+            (path, start): (size, mtime, message_id)
+            for path, start, size, mtime, message_id in rows
+        }
+
+    def check(self, key: tuple[str, int], size: int, mtime: int) -> tuple[bool, str | None]:
+        """Check if a message is unchanged, or if not, get the Message-ID to compare it to"""
+        row = self.messages.get(key)
+        if row is None or row[0] != size:
+            return False, None
+        return row[1] == mtime, row[2]
+
+    def update(self, rows: list[tuple]):
+        """Save (path, start, size, mtime, message_id) for processed messages"""
+        mode = int(self.content_addressed)
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)',
+                [(path, start, mode, *values) for path, start, *values in rows],
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def index_mbox(filename) -> Iterator[tuple[int, int]]:
+    """
+    Get the start and end offsets of each message in an mbox file, by scanning for 'From '
+    separator lines. The file is memory-mapped, so it doesn't need to be read into memory.
+    """
+    if os.path.getsize(filename) == 0:
         return
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        separator = 0 if mm[:5] == b'From ' else mm.find(b'\nFrom ') + 1
+        if separator == 0 and mm[:5] != b'From ':
+            return
+        while True:
+            # Each message starts after its separator line, and ends at the next one
+            start = mm.find(b'\n', separator) + 1 or len(mm)
+            end = mm.find(b'\nFrom ', start - 1) + 1 or len(mm)
+            if end > start:
+                yield start, end
+            if end == len(mm):
+                return
+            separator = end
+
+
+def _is_mbox(filename) -> bool:
+    with open(filename, 'rb') as f:
+        return f.read(5) == b'From '
+
+
+def _is_maildir(path) -> bool:
+    return all(os.path.isdir(os.path.join(path, subdir)) for subdir in MAILDIR_SUBDIRS)
+
+
+def _find_maildir_messages(path) -> Iterator[tuple[str, int, int | None]]:
+    """Find messages in a Maildir, and in any folders nested inside it (e.g., Maildir++ folders
+    like ``.Sent``)
+    """
+    for subdir in ['cur', 'new']:
+        for entry in os.scandir(os.path.join(path, subdir)):
+            if entry.is_file():
+                yield entry.path, 0, None
+    for entry in sorted(os.scandir(path), key=lambda e: e.name):
+        if entry.name not in MAILDIR_SUBDIRS and entry.is_dir() and _is_maildir(entry.path):
+            yield from _find_maildir_messages(entry.path)
+
+
+def find_messages(path) -> Iterator[tuple[str, int, int | None]]:
+    """
+    Find messages in an .eml file, mbox file, Maildir (including nested folders), or directory of
+    .eml files. Each message is returned as (filename, start offset, end offset), so messages from
+    a single mbox file can be split up between processes.
+    """
+    if not os.path.exists(path):
+        print(f'{path} not found. Skipping.')
+    elif os.path.isdir(path):
+        if _is_maildir(path):
+            yield from _find_maildir_messages(path)
+        else:
+            for filename in glob.iglob(os.path.join(glob.escape(path), f'*.{EXTENSION}')):
+                yield filename, 0, None
+    elif not path.endswith(f'.{EXTENSION}') and _is_mbox(path):
+        for start, end in index_mbox(path):
+            yield path, start, end
+    else:
+        yield path, 0, None
+
+
+@dataclass
+class Progress:
+    """Counts and throughput for a run, collected and reported by the parent process. Messages are
+    found and filtered in the pool's task handler thread while results are added in the main
+    thread, so updates are made with a lock.
+    """
+
+    found: int = 0
+    skipped: int = 0  # Unchanged since the last run (by size + mtime, or by Message-ID)
+    extracted: int = 0
+    attachments: int = 0
+    no_attachments: int = 0
+    errors: int = 0
+    bytes: int = 0
+    busy: dict[int, float] = field(default_factory=dict)  # Seconds spent working, per worker PID
+    unique: dict[str, int] = field(default_factory=dict)  # Size per digest, if content-addressed
+    stored: int = 0
+    stored_bytes: int = 0
+    started: float = field(default_factory=perf_counter)
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    def add_found(self, skipped: bool = False):
+        """Count a message found while scanning, and whether it was skipped before extracting"""
+        with self._lock:
+            self.found += 1
+            self.skipped += skipped
+
+    def add(self, pid: int, busy: float, results: list[ExtractResult], sizes: list[int]):
+        """Count results from a batch of extracted messages"""
+        with self._lock:
+            self.busy[pid] = self.busy.get(pid, 0) + busy
+            self.bytes += sum(sizes)
+            for result in results:
+                if result.skipped:
+                    self.skipped += 1
+                    continue
+                self.extracted += 1
+                self.attachments += result.attachments
+                self.no_attachments += result.attachments == 0 and not result.error
+                self.errors += bool(result.error)
+                for *_, digest, size in result.records:
+                    self.unique[digest] = size
+                    self.stored += 1
+                    self.stored_bytes += size
+
+    def report(self, final: bool = False):
+        elapsed = perf_counter() - self.started
+        done = self.extracted + self.skipped
+        print(
+            f'{"Done: " if final else ""}{done}/{self.found} messages, '
+            f'{self.bytes / 1024**2:.1f} MB in {elapsed:.1f}s '
+            f'({done / elapsed:.0f} messages/s, {self.bytes / 1024**2 / elapsed:.1f} MB/s)'
+        )
+        if not final:
+            return
+        print(
+            f'Extracted {self.attachments} attachments from {self.extracted} messages; '
+            f'skipped {self.skipped} unchanged; {self.no_attachments} had no attachments; '
+            f'{self.errors} errors'
+        )
+        if self.unique:
+            print(
+                f'Stored {len(self.unique)} unique attachments '
+                f'({sum(self.unique.values()) / 1024**2:.1f} MB) '
+                f'out of {self.stored} ({self.stored_bytes / 1024**2:.1f} MB)'
+            )
+        if self.busy:
+            utilization = ', '.join(
+                f'{pid}: {busy / elapsed:.0%}' for pid, busy in sorted(self.busy.items())
+            )
+            print(f'Worker utilization: {utilization}')
+
+
+def _filter_messages(
+    messages: Iterable[tuple[str, int, int | None]],
+    index: MessageIndex | None,
+    since: datetime | None,
+    sizes: dict[tuple[str, int], tuple[int, int]],
+    progress: Progress,
+) -> Iterator[tuple[tuple, int]]:
+    """Skip messages in files not modified since the given time, or unchanged since the last run.
+    Yields arguments for :py:func:`extract` and the size of each message, and saves the size and
+    mtime of each message in ``sizes``. Messages found more than once (e.g., from overlapping paths)
+    are only yielded the first time.
+    """
+    min_mtime = since.timestamp() * 1e9 if since else 0
+    stats: dict[str, os.stat_result] = {}
+    seen: set[tuple[str, int]] = set()
+    for filename, start, end in messages:
+        key = (os.path.abspath(filename), start)
+        if key in seen:
+            continue
+        seen.add(key)
+        if (stat := stats.get(filename)) is None:
+            stat = stats[filename] = os.stat(filename)
+        size = stat.st_size if end is None else end - start
+        if stat.st_mtime_ns < min_mtime:
+            progress.add_found(skipped=True)
+            continue
+        unchanged, known_id = index.check(key, size, stat.st_mtime_ns) if index else (False, None)
+        progress.add_found(skipped=unchanged)
+        if not unchanged:
+            sizes[key] = (size, stat.st_mtime_ns)
+            yield (filename, start, end, known_id), size
+
+
+def _schedule(
+    messages: Iterable[tuple[tuple, int]], workers: int | None = None
+) -> Iterator[list[tuple]]:
+    """Order messages largest first, within a sliding window of ``SCHEDULE_WINDOW`` messages, so
+    the biggest messages aren't left until the end. Small messages are grouped into batches to
+    reduce per-task overhead, but the remaining messages are split into at least one batch per
+    worker, so small runs still use every worker.
+    """
+    workers = workers or os.cpu_count() or 1
+    heap: list[tuple[int, int, tuple]] = []
+    batch: list[tuple] = []
+    batch_bytes = 0
+    max_messages = BATCH_MESSAGES
+    # A final None marks the end of input, and flushes the remaining messages
+    for i, message in enumerate(chain(messages, [None])):
+        if message is not None:
+            heappush(heap, (-message[1], i, message[0]))
+        else:
+            n_remaining = len(heap) + len(batch)
+            max_messages = max(1, min(BATCH_MESSAGES, -(-n_remaining // workers)))
+        while len(heap) > (SCHEDULE_WINDOW if message is not None else 0):
+            neg_size, _, args = heappop(heap)
+            if batch and batch_bytes - neg_size > BATCH_BYTES:
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(args)
+            batch_bytes -= neg_size
+            if batch_bytes >= BATCH_BYTES or len(batch) >= max_messages:
+                yield batch
+                batch, batch_bytes = [], 0
+    if batch:
+        yield batch
+
+
+def extract_all(paths=None, content_addressed=False, refresh=False, since=None):
+    """Extract attachments from all messages in the given paths, skipping any that are unchanged
+    since the last run (unless ``refresh=True``) or in files not modified since ``since``.
+
+    Messages are sent to workers while paths are still being scanned, and progress is reported
+    every ``PROGRESS_INTERVAL`` seconds.
+    """
+    index = MessageIndex(content_addressed=content_addressed)
+    progress = Progress()
+    workers = os.cpu_count() or 1
+    sizes: dict[tuple[str, int], tuple[int, int]] = {}
+    messages = (message for path in paths or ['.'] for message in find_messages(path))
+    batches = _schedule(
+        _filter_messages(messages, None if refresh else index, since, sizes, progress), workers
+    )
+
+    index_rows: list[tuple] = []
+    records: list[tuple] = []
+    last_report = perf_counter()
+
+    def save():
+        index.update(index_rows)
+        if records:
+            write_manifest(records)
+        index_rows.clear()
+        records.clear()
+
+    # let's do this in parallel, using cpu count as number of processes
+    try:
+        with Pool(workers) as pool:
+            task = partial(extract_batch, content_addressed=content_addressed)
+            for pid, busy, results in pool.imap_unordered(task, batches):
+                keys = [(os.path.abspath(r.filename), r.start) for r in results]
+                progress.add(pid, busy, results, [sizes[key][0] for key in keys])
+                for key, result in zip(keys, results, strict=True):
+                    if result.error:
+                        print(result.error)
+                        continue
+                    # Messages with matching Message-IDs are unchanged, but mtimes are updated
+                    index_rows.append((*key, *sizes.pop(key), result.message_id))
+                    records.extend(result.records)
+                if perf_counter() - last_report >= PROGRESS_INTERVAL:
+                    progress.report()
+                    save()
+                    last_report = perf_counter()
+    finally:
+        save()
+        index.close()
+
+    if progress.found == 0:
+        print('No messages found')
+    else:
+        progress.report(final=True)
+
 
-    print(f'Found {len(files)} files')
-    res = pool.map(extract, files)
-    pool.close()
-    pool.join()
-    # 2-element list holding number of files, number of attachments
-    numfiles = [sum(i) for i in zip(*res, strict=False)]
-    print('Done: Processed {} files with {} attachments.'.format(*numfiles))
+def main():
+    parser = argparse.ArgumentParser(description='Extract attachments from email messages')
+    parser.add_argument(
+        'paths',
+        nargs='*',
+        help='.eml files, mbox files, Maildir directories, or directories of .eml files '
+        '(default: .eml files in the current directory)',
+    )
+    parser.add_argument(
+        '-c',
+        '--content-addressed',
+        action='store_true',
+        help=f'Store each unique attachment once, under {OUTPUT_DIR}/{OBJECTS_DIR}/ by SHA-256 '
+        f'digest, with a manifest in {OUTPUT_DIR}/{MANIFEST}',
+    )
+    parser.add_argument(
+        '-r',
+        '--refresh',
+        action='store_true',
+        help='Re-extract all messages instead of skipping previously processed ones',
+    )
+    parser.add_argument(
+        '-s',
+        '--since',
+        type=datetime.fromisoformat,
+        help='Only process files modified since this date/time (ISO format, e.g. 2024-01-31)',
+    )
+    args = parser.parse_args()
+    extract_all(args.paths, args.content_addressed, args.refresh, args.since)
 
 
 if __name__ == '__main__':
-    extract_all()
+    main()
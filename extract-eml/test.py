@@ -0,0 +1,350 @@
+import binascii
+import email
+import os
+import random
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from email import policy
+from hashlib import sha256
+
+import extract_eml
+import pytest
+from extract_eml import decode_body, extract
+
+random.seed(0)
+BINARY = random.randbytes(5000)
+TEXT = ''.join(random.choice('abc =é\t\n') for _ in range(3000)) + ' \t\n'
+LONG_LINE = 'x' * 500
+
+
+def _part(headers: dict[str, str], body: str) -> str:
+    return ''.join(f'{k}: {v}\n' for k, v in headers.items()) + '\n' + body
+
+
+def _multipart(subtype: str, boundary: str, parts: list[str]) -> str:
+    """Multipart part with a preamble and epilogue"""
+    headers = {'Content-Type': f'multipart/{subtype}; boundary="{boundary}"'}
+    body = 'preamble\n' + ''.join(f'--{boundary}\n{part}\n' for part in parts)
+    return _part(headers, f'{body}--{boundary}--\nepilogue\n')
+
+
+def _attachment(filename: str, encoding: str, body: str, content_type='text/plain') -> str:
+    headers = {
+        'Content-Type': content_type,
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Content-Transfer-Encoding': encoding,
+    }
+    return _part(headers, body)
+
+
+def _make_message(eol: str) -> bytes:
+    """Make a message with nested multiparts, and attachments with each transfer encoding. Some
+    attachments have lines much longer than a line would normally be.
+    """
+    base64_wrapped = binascii.b2a_base64(BINARY).decode().strip()
+    base64_wrapped = '\n'.join(base64_wrapped[i : i + 76] for i in range(0, 6668, 76))
+    qp = binascii.b2a_qp(TEXT.encode()).decode()
+    # Without soft line breaks, each line is as long as the original text line
+    qp_long_lines = qp.replace('=\n', '')
+
+    alternative = _multipart(
+        'alternative',
+        'alt-boundary',
+        [_part({'Content-Type': 'text/plain'}, 'hello\n'), _part({}, '<p>hello</p>\n')],
+    )
+    related = _multipart(
+        'related',
+        'related_boundary_' + 'r' * 50,
+        [
+            _attachment('d.csv', '7bit', f'a,b\n1,2\n{LONG_LINE}\n', 'text/csv'),
+            _attachment(
+                'e.bin', 'base64', binascii.b2a_base64(BINARY[:3000]).decode(), 'image/png'
+            ),
+        ],
+    )
+    nested = _multipart(
+        'mixed',
+        'inner',
+        [
+            _attachment('b.txt', 'quoted-printable', qp),
+            _attachment('c.txt', 'quoted-printable', qp_long_lines),
+            related,
+        ],
+    )
+    message = _multipart(
+        'mixed',
+        'outer',
+        [
+            alternative,
+            _attachment('a.bin', 'base64', base64_wrapped, 'application/octet-stream'),
+            nested,
+            _attachment('f.txt', '7bit', f'line 1\n{LONG_LINE}\n\nline 4'),
+        ],
+    )
+    headers = _part({'Message-ID': '<1@example.com>', 'MIME-Version': '1.0'}, '')[:-1]
+    return (headers + message).replace('\n', eol).encode()
+
+
+def _make_simple_message(message_id: int, attachments: dict[str, str]) -> bytes:
+    """Make a message with a text attachment for each filename and content"""
+    parts = [_attachment(filename, '7bit', content) for filename, content in attachments.items()]
+    headers = _part({'Message-ID': f'<{message_id}@example.com>', 'MIME-Version': '1.0'}, '')
+    return (headers[:-1] + _multipart('mixed', 'boundary', parts)).encode()
+
+
+def _get_expected(path) -> dict[str, bytes]:
+    """Get decoded attachments using the stdlib email parser"""
+    with open(path) as f:
+        message = email.message_from_file(f, policy=policy.default)
+    return {
+        part.get_filename(): part.get_payload(decode=True)
+        for part in message.walk()
+        if not part.is_multipart() and part.get_filename()
+    }
+
+
+@pytest.mark.parametrize('eol', ['\n', '\r\n'])
+@pytest.mark.parametrize('chunk_size', [80, 97, 501, 64 * 1024])
+def test_extract(tmp_path, monkeypatch, eol, chunk_size):
+    """Attachments should be the same as with the stdlib parser, even when lines are read in
+    pieces. Chunk sizes must be at least as long as a boundary line.
+    """
+    monkeypatch.setattr(extract_eml, 'OUTPUT_DIR', str(tmp_path / 'output'))
+    monkeypatch.setattr(extract_eml, 'CHUNK_SIZE', chunk_size)
+    path = tmp_path / 'message.eml'
+    path.write_bytes(_make_message(eol))
+
+    expected = _get_expected(path)
+    assert sorted(expected) == ['a.bin', 'b.txt', 'c.txt', 'd.csv', 'e.bin', 'f.txt']
+    result = extract(str(path))
+    assert result.attachments == 6 and not result.error
+    assert sorted(os.listdir(tmp_path / 'output')) == sorted(expected)
+    for filename, content in expected.items():
+        assert (tmp_path / 'output' / filename).read_bytes() == content, filename
+
+
+def test_extract__mbox(tmp_path, monkeypatch):
+    """A message in an mbox file should only be read up to its end offset"""
+    monkeypatch.setattr(extract_eml, 'OUTPUT_DIR', str(tmp_path / 'output'))
+    message = _make_message('\n')
+    mbox = tmp_path / 'messages.mbox'
+    mbox.write_bytes(
+        b'From a@example.com\n' + message + b'\nFrom b@example.com\nSubject: 2\n\nhi\n'
+    )
+
+    offsets = list(extract_eml.index_mbox(mbox))
+    assert len(offsets) == 2
+    assert extract(str(mbox), *offsets[0]).attachments == 6
+    assert extract(str(mbox), *offsets[1]).attachments == 0
+
+
+@pytest.mark.parametrize(
+    'encoding, line',
+    [
+        ('quoted-printable', b'caf=C3=A9 =3D x=\r\n'),
+        ('quoted-printable', b'a=3D=3D=3Db\r\n'),
+        ('quoted-printable', b'trailing =20\n'),
+        ('7bit', b'a\r\nb\r\n'),
+    ],
+)
+def test_decode__split(encoding, line):
+    """Escapes, soft line breaks, and CRLF line endings should be decoded correctly when split
+    across pieces. The line break at the end of a body belongs to the next boundary, so the sample
+    body ends without one.
+    """
+    body = line + b'end'
+    expected = body.replace(b'\r\n', b'\n')
+    expected = binascii.a2b_qp(expected) if encoding == 'quoted-printable' else expected
+    # Split into pieces the same way as _LineReader, with each possible chunk size
+    for chunk_size in range(1, len(body)):
+        pieces = [
+            (line[i : i + chunk_size], i == 0)
+            for line in body.splitlines(keepends=True)
+            for i in range(0, len(line), chunk_size)
+        ]
+        assert b''.join(decode_body(iter(pieces), encoding)) == expected, chunk_size
+
+
+def test_decode_base64__split():
+    """Base64 should be decoded correctly when split at any point, including within a 4-byte
+    group or a line ending
+    """
+    encoded = binascii.b2a_base64(BINARY[:100]).replace(b'\n', b'\r\n')
+    for i in range(1, len(encoded)):
+        pieces = [(encoded[:i], True), (encoded[i:], False)]
+        assert b''.join(decode_body(iter(pieces), 'base64')) == BINARY[:100]
+
+
+def test_extract_all__duplicate_paths(tmp_path, monkeypatch, capsys):
+    """Messages reached more than once, from repeated or overlapping paths, should only be
+    extracted once
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'mail').mkdir()
+    (tmp_path / 'mail' / 'message.eml').write_bytes(_make_message('\n'))
+
+    extract_eml.extract_all(
+        ['mail/message.eml', 'mail/message.eml', 'mail', './mail'], refresh=True
+    )
+    assert 'Extracted 6 attachments from 1 messages' in capsys.readouterr().out
+
+
+def test_schedule():
+    """Messages should be sent largest first, and split between all workers even for small runs"""
+    messages = [((f'{i}.eml', 0, None, None), i * 1000) for i in range(32)]
+    batches = list(extract_eml._schedule(messages, workers=8))
+    assert [len(batch) for batch in batches] == [4] * 8
+    assert [args[0] for batch in batches for args in batch] == [
+        f'{i}.eml' for i in range(31, -1, -1)
+    ]
+
+    # Large runs should use full batches, and large messages should be sent on their own
+    messages = [((f'{i}.eml', 0, None, None), 100) for i in range(2000)]
+    messages.insert(500, (('big.eml', 0, None, None), extract_eml.BATCH_BYTES))
+    batches = list(extract_eml._schedule(messages, workers=8))
+    assert batches[0] == [('big.eml', 0, None, None)]
+    assert len(batches[1]) == extract_eml.BATCH_MESSAGES
+    assert sum(len(batch) for batch in batches) == 2001
+
+
+def test_find_messages__maildir(tmp_path, capsys):
+    """Messages should be found in a Maildir and its nested folders, and missing paths skipped"""
+    for folder in ['', '.Sent', '.Sent/.Archive', 'not_a_folder']:
+        for subdir in extract_eml.MAILDIR_SUBDIRS:
+            if folder != 'not_a_folder' or subdir != 'tmp':
+                (tmp_path / 'mail' / folder / subdir).mkdir(parents=True, exist_ok=True)
+        (tmp_path / 'mail' / folder / 'cur' / '1:2,S').write_bytes(b'Subject: 1\n\nhi\n')
+        (tmp_path / 'mail' / folder / 'new' / '2').write_bytes(b'Subject: 2\n\nhi\n')
+    (tmp_path / 'mail' / 'tmp' / '3').write_bytes(b'Subject: 3\n\nhi\n')
+
+    paths = [str(tmp_path / 'mail'), str(tmp_path / 'missing.mbox')]
+    found = [m for path in paths for m in extract_eml.find_messages(path)]
+    assert sorted(os.path.relpath(filename, tmp_path) for filename, *_ in found) == [
+        'mail/.Sent/.Archive/cur/1:2,S',
+        'mail/.Sent/.Archive/new/2',
+        'mail/.Sent/cur/1:2,S',
+        'mail/.Sent/new/2',
+        'mail/cur/1:2,S',
+        'mail/new/2',
+    ]
+    assert 'missing.mbox not found' in capsys.readouterr().out
+
+
+def test_extract_all__mbox(tmp_path, monkeypatch, capsys):
+    """Messages in an mbox file should be sent to workers in separate batches, and all extracted"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(extract_eml, 'BATCH_MESSAGES', 3)
+    messages = [_make_simple_message(i, {f'{i}.txt': f'message {i}\n'}) for i in range(10)]
+    (tmp_path / 'messages.mbox').write_bytes(
+        b''.join(b'From sender@example.com\n' + message + b'\n' for message in messages)
+    )
+
+    batches = []
+    schedule = extract_eml._schedule
+
+    def record_batches(*args):
+        for batch in schedule(*args):
+            batches.append(batch)
+            yield batch
+
+    monkeypatch.setattr(extract_eml, '_schedule', record_batches)
+    extract_eml.extract_all(['messages.mbox'])
+    assert 'Extracted 10 attachments from 10 messages' in capsys.readouterr().out
+    assert all(len(batch) <= 3 for batch in batches)
+    assert len({start for batch in batches for _, start, *_ in batch}) == 10
+    assert sorted(os.listdir('output')) == sorted(
+        [extract_eml.STATE_DIR] + [f'{i}.txt' for i in range(10)]
+    )
+    assert (tmp_path / 'output' / '9.txt').read_text() == 'message 9\n'
+
+
+def test_extract_all__content_addressed(tmp_path, monkeypatch, capsys):
+    """Identical attachments should only be stored once, and different attachments with the same
+    name should both be stored, with a manifest of which attachments came from which messages
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.eml').write_bytes(
+        _make_simple_message(1, {'report.txt': 'same\n', 'a.txt': 'only in a\n'})
+    )
+    (tmp_path / 'b.eml').write_bytes(
+        _make_simple_message(2, {'report.txt': 'different\n', 'copy.txt': 'same\n'})
+    )
+
+    extract_eml.extract_all(content_addressed=True)
+    assert 'Stored 3 unique attachments' in capsys.readouterr().out
+    objects = tmp_path / 'output' / extract_eml.OBJECTS_DIR
+    digest = sha256(b'same\n').hexdigest()
+    assert (objects / digest[:2] / digest).read_bytes() == b'same\n'
+    assert len([p for p in objects.rglob('*') if p.is_file()]) == 3
+
+    with closing(sqlite3.connect(tmp_path / 'output' / extract_eml.MANIFEST)) as conn:
+        rows = conn.execute('SELECT message, message_id, filename, digest FROM attachments')
+        manifest = {(os.path.basename(m), filename): (mid, d) for m, mid, filename, d in rows}
+    assert manifest[('a.eml', 'report.txt')] == ('<1@example.com>', digest)
+    assert manifest[('b.eml', 'copy.txt')] == ('<2@example.com>', digest)
+    assert manifest[('b.eml', 'report.txt')][1] != digest
+    assert len(manifest) == 4
+
+
+def _extract_all(capsys, **kwargs) -> str:
+    """Run extract_all, and get the summary line"""
+    extract_eml.extract_all(**kwargs)
+    return next(line for line in capsys.readouterr().out.splitlines() if line.startswith('Extr'))
+
+
+def test_extract_all__index(tmp_path, monkeypatch, capsys):
+    """Unchanged messages should be skipped on reruns, separately for each output mode"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.eml').write_bytes(_make_simple_message(1, {'a.txt': 'a\n'}))
+    (tmp_path / 'b.eml').write_bytes(_make_simple_message(2, {'b.txt': 'b\n'}))
+    assert _extract_all(capsys).startswith('Extracted 2 attachments from 2 messages; skipped 0')
+    assert _extract_all(capsys).startswith('Extracted 0 attachments from 0 messages; skipped 2')
+
+    # Changed size: extracted again
+    (tmp_path / 'b.eml').write_bytes(_make_simple_message(2, {'b.txt': 'bb\n'}))
+    assert _extract_all(capsys).startswith('Extracted 1 attachments from 1 messages; skipped 1')
+    assert (tmp_path / 'output' / 'b.txt').read_text() == 'bb\n'
+
+    # Changed mtime, but the same Message-ID: skipped after reading headers
+    os.utime(tmp_path / 'a.eml', ns=(0, 10**18))
+    assert _extract_all(capsys).startswith('Extracted 0 attachments from 0 messages; skipped 2')
+
+    # Messages processed in one output mode should still be extracted in the other
+    summary = _extract_all(capsys, content_addressed=True)
+    assert summary.startswith('Extracted 2 attachments from 2 messages; skipped 0')
+    assert _extract_all(capsys, refresh=True).startswith('Extracted 2 attachments')
+
+
+def test_extract_all__since(tmp_path, monkeypatch, capsys):
+    """Files not modified since the given time should be skipped, even with ``refresh=True``"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'old.eml').write_bytes(_make_simple_message(1, {'old.txt': 'old\n'}))
+    (tmp_path / 'new.eml').write_bytes(_make_simple_message(2, {'new.txt': 'new\n'}))
+    os.utime(tmp_path / 'old.eml', (datetime(2020, 1, 1).timestamp(),) * 2)
+
+    summary = _extract_all(capsys, refresh=True, since=datetime(2024, 1, 1))
+    assert summary.startswith('Extracted 1 attachments from 1 messages; skipped 1')
+    assert sorted(os.listdir(tmp_path / 'output')) == sorted(['new.txt', extract_eml.STATE_DIR])
+
+
+def test_extract_all__progress(tmp_path, monkeypatch, capsys):
+    """Messages found, skipped, and extracted should all be counted in the final report"""
+    monkeypatch.chdir(tmp_path)
+    for i in range(40):
+        attachments = {f'{i}.txt': f'{i}\n'} if i % 4 else {}
+        (tmp_path / f'{i}.eml').write_bytes(_make_simple_message(i, attachments))
+    extract_eml.extract_all()
+    output = capsys.readouterr().out
+    assert 'Extracted 30 attachments from 40 messages; skipped 0 unchanged; 10 had no' in output
+    for i in range(10):
+        (tmp_path / f'{i}.eml').write_bytes(_make_simple_message(i, {f'{i}.txt': f'{i}{i}\n'}))
+
+    extract_eml.extract_all()
+    output = capsys.readouterr().out.splitlines()
+    assert output[-3].startswith('Done: 40/40 messages')
+    assert output[-2] == (
+        'Extracted 10 attachments from 10 messages; skipped 30 unchanged; 0 had no attachments; '
+        '0 errors'
+    )
+    assert output[-1].startswith('Worker utilization: ')
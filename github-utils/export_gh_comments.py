@@ -7,20 +7,19 @@
 # ]
 # ///
 from datetime import datetime
+from functools import cache
 from os import environ
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from dotenv import load_dotenv
-from requests_cache import CachedSession
+
+if TYPE_CHECKING:
+    from requests_cache import CachedSession
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 load_dotenv(SCRIPT_DIR / '.env')
 
-SESSION = CachedSession(
-    SCRIPT_DIR / 'github.db', expire_after=360, allowable_methods=('GET', 'POST')
-)
-SESSION.headers.update({'Authorization': f'Bearer {environ.get("GITHUB_TOKEN")}'})
-
 QUERY = """
 query($username: String!, $cursor: String) {
     user(login: $username) {
@@ -103,16 +102,28 @@ query($username: String!, $cursor: String) {
 """
 
 
+@cache
+def get_session() -> 'CachedSession':
+    """Get an authenticated, cached session, created on first use"""
+    from requests_cache import CachedSession
+
+    session = CachedSession(
+        SCRIPT_DIR / 'github.db', expire_after=360, allowable_methods=('GET', 'POST')
+    )
+    session.headers.update({'Authorization': f'Bearer {environ.get("GITHUB_TOKEN")}'})
+    return session
+
+
 def get_current_user() -> str:
     """Get the currently logged in user's GitHub username"""
-    response = SESSION.get('https://api.github.com/user')
+    response = get_session().get('https://api.github.com/user')
     response.raise_for_status()
     return response.json()['login']
 
 
 def fetch_github_comments(username: str, cursor=None):
     """Fetch all comments made by a GitHub user using the GitHub GraphQL API"""
-    response = SESSION.post(
+    response = get_session().post(
         'https://api.github.com/graphql',
         json={
             'query': QUERY,
@@ -242,7 +253,7 @@ def main():
     print(f'Fetching comments for: {username}')
     comments = fetch_github_comments(username)
     format_comments(comments)
-    SESSION.cache.delete(expired=True)
+    get_session().cache.delete(expired=True)
 
 
 if __name__ == '__main__':
@@ -11,21 +11,18 @@ import argparse
 import re
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from functools import cache
 from html import unescape
 from logging import basicConfig, getLogger
 from operator import attrgetter
 from pathlib import Path
+from typing import TYPE_CHECKING
 from urllib.parse import unquote
 
-from requests_cache import CachedSession
-from rich.progress import track
+if TYPE_CHECKING:
+    from requests_cache import CachedSession
 
 logger = getLogger(__name__)
-session = CachedSession(
-    'yt_pages.db',
-    use_temp=True,
-    expire_after=timedelta(hours=1),
-)
 
 
 @dataclass
@@ -57,6 +54,8 @@ def parse_videos(
     input_file: str | str, sort_col: str = 'date', ascending: bool = False
 ) -> list[Video]:
     """Get Video objects from a text file containing YouTube URLs"""
+    from rich.progress import track
+
     urls = _get_yt_urls(input_file)
     videos = []
     for url in track(urls, description='Fetching video metadata...'):
@@ -103,7 +102,19 @@ def _get_html(url: str) -> str:
     """Get HTML by URL or YouTube video ID"""
     if not url.startswith('http'):
         url = f'https://www.youtube.com/watch?v={url}'
-    return session.get(url).text
+    return get_session().get(url).text
+
+
+@cache
+def get_session() -> 'CachedSession':
+    """Get a cached session, created on first use so --help doesn't need to open the cache"""
+    from requests_cache import CachedSession
+
+    return CachedSession(
+        'yt_pages.db',
+        use_temp=True,
+        expire_after=timedelta(hours=1),
+    )
 
 
 def _normalize_url(url: str) -> str:
@@ -1,5 +1,6 @@
 """Load settings from environment variables and/or .env file"""
 
+from functools import cache
 from logging import basicConfig, getLogger
 from os import getenv
 from pathlib import Path
@@ -42,15 +43,24 @@ class EnvConfig:
 load_dotenv(Path(__file__).resolve().parent / '.env')
 CONFIG = environ.to_config(EnvConfig)
 
-VJA_SESSION = Session()
-VJA_SESSION.headers = {'Authorization': f'Bearer {CONFIG.vja_token}'}
-
-NC_SESSION = Session()
-NC_SESSION.auth = HTTPBasicAuth(CONFIG.nc_user, getenv('NC_PASS'))
-
 basicConfig(
     format='%(asctime)s [%(name)s] [%(levelname)-5s] %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S',
     level=CONFIG.log_level,
 )
 getLogger('urllib3').setLevel('WARN')
+
+
+# Sessions are created on first use, rather than on import
+@cache
+def get_vja_session() -> Session:
+    session = Session()
+    session.headers = {'Authorization': f'Bearer {CONFIG.vja_token}'}
+    return session
+
+
+@cache
+def get_nc_session() -> Session:
+    session = Session()
+    session.auth = HTTPBasicAuth(CONFIG.nc_user, getenv('NC_PASS'))
+    return session
@@ -7,9 +7,7 @@ from logging import getLogger
 from textwrap import dedent
 from typing import Iterator
 
-from config import CONFIG, VJA_SESSION
-from dateutil.parser import parse as parse_date
-from html2text import HTML2Text
+from config import CONFIG, get_vja_session
 
 # Settings from environment variables and/or .env file
 API_BASE_URL = f'https://{CONFIG.vja_host}/api/v1'
@@ -64,7 +62,7 @@ def get_tasks() -> Iterator[Task]:
     # Add comments and project titles
     logger.debug('Fetching comments')
     for task in tasks:
-        response = VJA_SESSION.get(f'{API_BASE_URL}/tasks/{task["id"]}/comments')
+        response = get_vja_session().get(f'{API_BASE_URL}/tasks/{task["id"]}/comments')
         task['comments'] = response.json()
         if project_id := task.pop('project_id', None):
             task['project'] = project_titles[project_id]
@@ -86,7 +84,7 @@ def get_tasks() -> Iterator[Task]:
         yield Task(
             id=int(task['id']),
             filename=get_task_filename(task),
-            mtime=parse_date(task['updated']),
+            mtime=_parse_date(task['updated']),
             detail=get_task_detail(task),
             summary=get_task_summary(task),
         )
@@ -94,12 +92,12 @@ def get_tasks() -> Iterator[Task]:
 
 def _paginate(url: str):
     """Get all pages from a paginated API endpoint"""
-    response = VJA_SESSION.get(url)
+    response = get_vja_session().get(url)
     response.raise_for_status()
     total_pages = int(response.headers['x-pagination-total-pages'])
     records = response.json()
     for page in range(2, total_pages + 1):
-        response = VJA_SESSION.get(url, params={'page': page})
+        response = get_vja_session().get(url, params={'page': page})
         response.raise_for_status()
         records += response.json()
     return records
@@ -115,7 +113,7 @@ def get_task_detail(task: dict) -> str:
         return ''
 
     labels = ', '.join([label['title'] for label in task['labels'] or []])
-    completed_dt = parse_date(task['done_at']) if task['done'] else 'N/A'
+    completed_dt = _parse_date(task['done_at']) if task['done'] else 'N/A'
     project_str = task['project']
     if bucket := task.get('bucket'):
         project_str += f' ({bucket})'
@@ -159,9 +157,17 @@ def get_task_summary(task: dict) -> str:
 
 def _convert_text(text: str) -> str:
     """Convert HTML content to Markdown"""
+    from html2text import HTML2Text
+
     md_text = HTML2Text().handle(text)
     return dedent(md_text).strip()
 
 
+def _parse_date(timestamp: str) -> datetime:
+    from dateutil.parser import parse
+
+    return parse(timestamp)
+
+
 def _format_dt(timestamp: str) -> str:
-    return parse_date(timestamp).strftime(DT_FORMAT) if timestamp else 'N/A'
+    return _parse_date(timestamp).strftime(DT_FORMAT) if timestamp else 'N/A'
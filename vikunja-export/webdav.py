@@ -9,8 +9,7 @@ from logging import getLogger
 from pathlib import Path
 from xml.etree import ElementTree
 
-from config import CONFIG, NC_SESSION
-from dateutil.parser import parse as parse_date
+from config import CONFIG, get_nc_session
 
 logger = getLogger(__name__)
 
@@ -24,6 +23,8 @@ class RemoteFile:
 
     @classmethod
     def from_xml(cls, element) -> 'RemoteFile':
+        from dateutil.parser import parse as parse_date
+
         path = element.find('.//{DAV:}href').text
         filename = path.split('/')[-1]
         try:
@@ -41,7 +42,7 @@ class RemoteFile:
 
 def webdav_ls() -> list[RemoteFile]:
     """List all files in the remote directory"""
-    response = NC_SESSION.request('PROPFIND', CONFIG.nc_base_url, headers={'Depth': '1'})
+    response = get_nc_session().request('PROPFIND', CONFIG.nc_base_url, headers={'Depth': '1'})
     xml_response = ElementTree.fromstring(response.content).findall('{DAV:}response')
     return [RemoteFile.from_xml(element) for element in xml_response if not _is_dir(element)]
 
@@ -53,7 +54,7 @@ def _is_dir(element) -> bool:
 def webdav_upload(data: str, filename: Path):
     """Upload files to Nextcloud via WebDAV"""
     dest_url = f'{CONFIG.nc_base_url}/{filename}'
-    response = NC_SESSION.put(
+    response = get_nc_session().put(
         dest_url,
         data=data.encode(),
     )
@@ -66,7 +67,7 @@ def webdav_upload(data: str, filename: Path):
 
 def webdav_rename(src_path, dest_path):
     """Rename a file on the remote server"""
-    response = NC_SESSION.request(
+    response = get_nc_session().request(
         'MOVE',
         f'{CONFIG.nc_base_url}/{src_path}',
         headers={'Destination': f'{CONFIG.nc_base_url}/{dest_path}'},
@@ -79,7 +80,7 @@ def webdav_rename(src_path, dest_path):
 
 def webdav_delete(remote_path):
     """Delete a file on the remote server"""
-    response = NC_SESSION.delete(f'{CONFIG.nc_base_url}/{remote_path}')
+    response = get_nc_session().delete(f'{CONFIG.nc_base_url}/{remote_path}')
     if response.status_code == 204:
         logger.debug(f'Deleted {remote_path}')
     else:
@@ -88,7 +89,7 @@ def webdav_delete(remote_path):
 
 def webdav_mkdir(remote_path):
     """Create the remote folder if it doesn't already exist"""
-    response = NC_SESSION.request('MKCOL', remote_path)
+    response = get_nc_session().request('MKCOL', remote_path)
     if response.status_code == 201:
         logger.debug(f'Folder {CONFIG.nc_dir} created')
     elif response.status_code == 405: